@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+###################################################################################################
+# changes :                                                                                       #
+# 20261018-XJS : 1.2       Initial, benchmark of RUN mode of LogfileMonitor.py with synthetic     #
+#                          logfiles                                                               #
+###################################################################################################
+Benchmark of RUN mode:
+    - Generate the synthetic logfiles with the size, line length and match rate, and the parameter files with
+      the number of patterns for every patternsearchtype, for "readtype: full" and "readtype: incremental";
+    - Run the intervals of RUN mode (RunCycle of LogfileMonitor.py) against them, the first one reads the whole
+      logfiles, and the data is appended to every logfile before each of the others;
+    - Report lines/s, MB/s, events/s, peak RSS, the percentiles of the interval time and the time of every phase
+      (see RunMetrics of LogfileMonitor.py) as JSON.
+The logs are written to the log file of LogfileMonitor.py with WARNING, to measure the search only.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+# LogfileMonitor.py is in src/, the benchmark is kept out of it not to be built and published by build.sh
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+import LogfileMonitor
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+VERSION = "1.2 20261018"
+
+SCRIPT_NAME = os.path.basename(__file__)
+
+# The patternsearchtype, and the prefix of the matched text for every pattern of it
+PATTERN_TYPES = [("substring", "bench-sub"), ("starts with", "bench-start"), ("ends with", "bench-end"),
+                 ("full", "bench-full"), ("regexp", "bench-re")]
+
+# The words of the lines which are not matched
+FILLER_WORDS = ["kernel:", "systemd[1]:", "sshd[2041]:", "INFO", "DEBUG", "connection", "from", "10.0.0.12",
+                "accepted", "request", "served", "in", "12ms", "user", "session", "cache", "updated", "GET", "/index"]
+
+
+def usage():
+    print("Usage is:")
+    print("          %s -d <Working directory> [-s <Size of logfile, MB>] [-n <Number of logfiles>] "
+          "[-r <Patterns per type>] [-l <Line length, min-max>] [-t <Match rate>] [-c <Intervals>] "
+          "[-a <Appended size per interval, MB>] [-f {yaml | jsonl}] [-o <JSON file>]" % SCRIPT_NAME)
+    print("      or: %s -v" % SCRIPT_NAME)
+    print("      or: %s -h" % SCRIPT_NAME)
+    print("")
+    print("    -d <Working directory>  Required, the logfiles and parameter files are generated in it")
+    print("    -s <Size of logfile, MB>  Optional, default is 10")
+    print("    -n <Number of logfiles>  Optional, default is 4")
+    print("    -r <Patterns per type>  Optional, the number of patterns for every patternsearchtype, default is 5")
+    print("    -l <Line length, min-max>  Optional, the length of lines is uniform in the range, default is 40-200")
+    print("    -t <Match rate>  Optional, the rate of lines which are matched by any pattern, default is 0.01")
+    print("    -c <Intervals>  Optional, the number of intervals for every readtype, default is 10")
+    print("    -a <Appended size per interval, MB>  Optional, default is 1")
+    print("    -f {yaml | jsonl}  Optional, the format of output file, default is yaml")
+    print("    -o <JSON file>  Optional, the result is printed if it is missing")
+    print("    -v  Show the current version information")
+    print("    -h  Show the usage of the script")
+
+
+def get_pattern_text(search_type, prefix, k, rand=random):
+    """
+    Get the pattern and a line matched by it
+    :param search_type: patternsearchtype
+    :param prefix: The prefix of the matched text
+    :param k: The index of pattern for the type
+    :param rand: random.Random, to generate the same logfiles every time
+    :return: patternsearch, line
+    """
+    text = "%s-%d" % (prefix, k)
+    if search_type == "regexp":
+        return r"%s id=\d+" % text, "%s id=%d" % (text, rand.randint(0, 99))
+    return text, text
+
+
+def make_line(rand, length, patterns, match_rate):
+    """
+    Generate a line, which is matched by a random pattern with match_rate
+    :param rand: random.Random
+    :param length: The length of the line
+    :param patterns: [(patternsearchtype, prefix, index)]
+    :param match_rate: The rate of matched lines
+    :return: The line with line break
+    """
+    words = []
+    size = 0
+    while size < length:
+        word = rand.choice(FILLER_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    line = " ".join(words)[:length]
+
+    if patterns and rand.random() < match_rate:
+        search_type, prefix, k = rand.choice(patterns)
+        text = get_pattern_text(search_type, prefix, k, rand)[1]
+        if search_type == "full":
+            line = text
+        elif search_type == "starts with":
+            line = text + " " + line
+        elif search_type == "ends with":
+            line = line + " " + text
+        else:
+            pos = rand.randint(0, len(line))
+            line = line[:pos] + " " + text + " " + line[pos:]
+
+    return line + "\n"
+
+
+def append_logfile(logfilename, size, rand, line_length, patterns, match_rate):
+    """
+    Append the generated lines to the logfile
+    :param logfilename:
+    :param size: The number of bytes to append at least
+    :param rand: random.Random
+    :param line_length: (min, max) of the length of lines
+    :param patterns: [(patternsearchtype, prefix, index)]
+    :param match_rate: The rate of matched lines
+    :return: The number of appended bytes and lines
+    """
+    lines = []
+    num_bytes = 0
+    while num_bytes < size:
+        line = make_line(rand, rand.randint(line_length[0], line_length[1]), patterns, match_rate)
+        lines.append(line)
+        num_bytes += len(line)
+
+    with open(logfilename, "a") as f:
+        f.write("".join(lines))
+
+    return num_bytes, len(lines)
+
+
+def write_param_file(param_file, logfilename, read_type, patterns):
+    """
+    Generate the parameter file with all the patterns
+    :param param_file:
+    :param logfilename: The regexp of logfilename
+    :param read_type: incremental/full
+    :param patterns: [(patternsearchtype, prefix, index)]
+    :return:
+    """
+    lines = ['- logicalname: "bench-%s"' % read_type,
+             "  logfilename: '%s'" % logfilename,
+             '  instance: "logfile"',
+             '  eventtype: "Application"',
+             '  readtype: "%s"' % read_type,
+             '  rotation: "n"',
+             '  deduplicate: "y"',
+             '  occurrences: "1"',
+             '  responsible: "Benchmark"',
+             '  patternmatch:']
+    for search_type, prefix, k in patterns:
+        lines.append('  - patternsearchtype: "%s"' % search_type)
+        lines.append("    patternsearch: '%s'" % get_pattern_text(search_type, prefix, k)[0])
+        lines.append('    sevmap: "minor"')
+
+    with open(param_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def get_peak_rss():
+    """
+    :return: The peak resident set size of the process in KB, or None if it is not supported
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # It is in bytes on macOS
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+
+def get_percentile(values, percent):
+    """
+    :param values: The sorted values
+    :param percent: E.g 90
+    :return: The value at the percentile with the nearest rank
+    """
+    if not values:
+        return None
+    rank = max(int(-(-len(values) * percent // 100)), 1)
+    return values[rank - 1]
+
+
+def run_bench(working_dir, read_type, options, patterns):
+    """
+    Run the intervals of RUN mode for the readtype
+    :param working_dir: The working directory of the benchmark
+    :param read_type: incremental/full
+    :param options: The parameters of the benchmark
+    :param patterns: [(patternsearchtype, prefix, index)]
+    :return: The result (dict)
+    """
+    bench_dir = os.path.join(working_dir, read_type)
+    log_dir = os.path.join(bench_dir, "logs")
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    for f in os.listdir(bench_dir):
+        if os.path.isfile(os.path.join(bench_dir, f)):
+            os.remove(os.path.join(bench_dir, f))
+    for f in os.listdir(log_dir):
+        os.remove(os.path.join(log_dir, f))
+
+    # The same logfiles for every readtype
+    rand = random.Random(0)
+    logfiles = [os.path.join(log_dir, "bench-%d.log" % i) for i in range(options["files"])]
+    total_bytes = 0
+    total_lines = 0
+    for logfilename in logfiles:
+        num_bytes, num_lines = append_logfile(logfilename, options["size"], rand, options["line_length"], patterns,
+                                              options["match_rate"])
+        total_bytes += num_bytes
+        total_lines += num_lines
+
+    param_file = os.path.join(bench_dir, "LogfileMonitorParam.yml")
+    write_param_file(param_file, os.path.join(log_dir, r"bench-\d+\.log$"), read_type, patterns)
+
+    LogfileMonitor.OUT_FORMAT = options["format"]
+    LogfileMonitor.OUT_FILE = os.path.join(bench_dir, "LogfileMonitorOut.%s" % (
+        "jsonl" if options["format"] == "jsonl" else "yml"))
+    LogfileMonitor.OUT_ITEM_SAMPLE = {}
+    checkpoint_store = LogfileMonitor.CheckpointStore(os.path.join(bench_dir, "LogfileMonitor.loc"))
+    run_cycle = LogfileMonitor.RunCycle(param_file, checkpoint_store, os.path.join(bench_dir, "LogfileMonitor.lag"))
+
+    cycles = []
+    for i in range(options["cycles"]):
+        if i > 0:
+            # Append the data to every logfile before the interval, it is not measured
+            total_bytes = 0
+            total_lines = 0
+            for logfilename in logfiles:
+                num_bytes, num_lines = append_logfile(logfilename, options["append"], rand, options["line_length"],
+                                                      patterns, options["match_rate"])
+                total_bytes += num_bytes
+                total_lines += num_lines
+            # The intervals run one after another, so the appended logfiles are told to be changed as with
+            # "-w inotify", instead of waiting for pollmin
+            run_cycle.changed_files = set(logfiles)
+
+        start = time.time()
+        events = run_cycle.run()
+        seconds = time.time() - start
+        cycles.append(dict(seconds=seconds, bytes=total_bytes, lines=total_lines, events=events))
+
+    def get_rates(items):
+        seconds = sum(item["seconds"] for item in items) or 1e-9
+        return dict(seconds=round(seconds, 6),
+                    lines_per_second=round(sum(item["lines"] for item in items) / seconds, 1),
+                    mb_per_second=round(sum(item["bytes"] for item in items) / seconds / 1024 / 1024, 3),
+                    events_per_second=round(sum(item["events"] for item in items) / seconds, 1))
+
+    # The first interval reads the whole logfiles, and the others read the appended data
+    latencies = sorted(item["seconds"] for item in cycles[1:])
+    result = dict(first_cycle=get_rates(cycles[:1]),
+                  next_cycles=get_rates(cycles[1:]) if cycles[1:] else None,
+                  cycle_latency=dict((name, round(get_percentile(latencies, percent), 6) if latencies else None)
+                                     for name, percent in [("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)]),
+                  events=sum(item["events"] for item in cycles),
+                  phase_seconds=dict((phase, round(seconds, 6))
+                                     for phase, seconds in run_cycle.metrics.phase_seconds.items()),
+                  cycles=[dict((k, round(v, 6) if k == "seconds" else v) for k, v in item.items())
+                          for item in cycles])
+
+    return result
+
+
+def main():
+    try:
+        # The logs are written to the log file of LogfileMonitor.py, with WARNING to measure the search only
+        LogfileMonitor.setup_logging("warning")
+
+        mydict = LogfileMonitor.get_argv_dict(sys.argv)
+
+        if "-v" in mydict.keys():
+            print(VERSION)
+            raise SystemExit(0)
+
+        if "-h" in mydict.keys() or "-d" not in mydict.keys():
+            usage()
+            raise SystemExit(0 if "-h" in mydict.keys() else 1)
+
+        para = ["script", "-d", "-s", "-n", "-r", "-l", "-t", "-c", "-a", "-f", "-o", "-v", "-h"]
+        for i in mydict.keys():
+            if i not in para:
+                logging.error("The parameter is not supported: %s" % i)
+                raise SystemExit(3)
+
+        try:
+            line_length = [int(i) for i in mydict.get("-l", "40-200").split("-")]
+            options = dict(size=int(float(mydict.get("-s", "10")) * 1024 * 1024),
+                           files=int(mydict.get("-n", "4")),
+                           rules=int(mydict.get("-r", "5")),
+                           line_length=(line_length[0], line_length[-1]),
+                           match_rate=float(mydict.get("-t", "0.01")),
+                           cycles=int(mydict.get("-c", "10")),
+                           append=int(float(mydict.get("-a", "1")) * 1024 * 1024),
+                           format=mydict.get("-f", "yaml").lower())
+        except ValueError as e:
+            logging.error("The parameter is not valid: %s" % e)
+            print("The parameter is not valid: %s" % e)
+            raise SystemExit(3)
+        if options["format"] not in ["yaml", "jsonl"] or options["cycles"] < 1 or options["files"] < 1:
+            print("The parameter is not valid")
+            raise SystemExit(3)
+
+        working_dir = mydict["-d"]
+        patterns = [(search_type, prefix, k) for search_type, prefix in PATTERN_TYPES for k in range(options["rules"])]
+
+        results = dict(version=VERSION,
+                       python=sys.version.split()[0],
+                       platform=sys.platform,
+                       parameters=dict(options, line_length="%d-%d" % options["line_length"]),
+                       results=dict((read_type, run_bench(working_dir, read_type, options, patterns))
+                                    for read_type in ["full", "incremental"]),
+                       peak_rss_kb=get_peak_rss())
+
+        result = json.dumps(results, indent=2, sort_keys=True)
+        if "-o" in mydict.keys():
+            with open(mydict["-o"], "w") as f:
+                f.write(result + "\n")
+        else:
+            print(result)
+    except SystemExit as error_code:
+        sys.exit(error_code)
+    finally:
+        if LogfileMonitor.LOG_LISTENER:
+            LogfileMonitor.LOG_LISTENER.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,7 @@ if [ $num == 1 ]; then
     docker pull ${DOCKER_IMG}
   fi
 
-  for i in `ls *.py`
+  for i in `ls *.py | grep -v "^test_"`
   do
     docker run -v "$(pwd):/src/" docker.io/${DOCKER_IMG} "pyinstaller --onefile --clean $i"
   done
@@ -28,7 +28,7 @@ if [ $num == 1 ]; then
     docker pull ${DOCKER_IMG}
   fi
   
-  for i in `ls *.py`
+  for i in `ls *.py | grep -v "^test_"`
   do
     docker run -v "$(pwd):/src/" docker.io/${DOCKER_IMG} "pyinstaller --onefile --clean $i"
   done
@@ -18,21 +18,89 @@
 #                          - REQ14: Generate event by READ mode while in TTL;                     #
 #                          - REQ15: extract fields for logfield1, logfield2 from matched entries; #
 #                          - Set TTL as 99 if it is missing in parameter file;                    #
+# 20261018-XJS : 1.2       - Read every logfile once per interval for all of its patterns;        #
+#                          - Save byte offset into checkpoint, and seek to it for incremental;    #
+#                          - Recognise rotated/trimmed logfile by inode & fingerprint, and read   #
+#                            the unread lines of the rotated file at first;                       #
+#                          - Load checkpoints once, and save the changed ones with one append     #
+#                            per interval;                                                        #
+#                          - Compile the search patterns once with regexps, matchers and fixed    #
+#                            output fields;                                                       #
+#                          - Search all the literal patterns of a logfile with one combined       #
+#                            regexp;                                                              #
+#                          - Search the regexp pattern only from the lines with its required      #
+#                            literal;                                                             #
+#                          - Aggregate the matched contents while searching, limited by           #
+#                            maxdistinct;                                                         #
+#                          - Buffer the output of RUN mode, and append it with one write per      #
+#                            interval;                                                            #
+#                          - Add JSON Lines output format (-f jsonl), READ mode reads the new     #
+#                            data from its cursor;                                                #
+#                          - Added '-w inotify' to read the logfiles while they are changed in    #
+#                            RUN mode                                                             #
+#                          - Read a logfile in RUN mode only if its stat is changed, with         #
+#                            adaptive interval by pollmin/pollmax                                 #
+#                          - Cache the exact logfilenames of every directory until its mtime is   #
+#                            changed                                                              #
+#                          - Load the parameter file once in RUN mode, again only if it is        #
+#                            changed or on SIGHUP                                                 #
+#                          - Check the running process once with the lock of pid file, instead    #
+#                            of 'ps -ef' every interval                                           #
+#                          - Added '-j <workers>' to scan the logfiles in parallel processes in   #
+#                            RUN mode                                                             #
+#                          - Read the logfile with blocks, and search the literals from bytes to  #
+#                            decode the matched lines only                                        #
+#                          - Cache the result of readtype full, and search only the appended      #
+#                            lines of the logfile                                                 #
+#                          - Read at most maxbytes/maxlines per interval and CYCLE_TIME_BUDGET,   #
+#                            with the lag in LogfileMonitor.lag                                   #
+#                          - RunCycle keeps the state of RUN mode across intervals,               #
+#                            bench/LogfileMonitorBench.py measures it with synthetic logfiles;    #
+#                          - Count and time every logfile, pattern and phase of RUN mode, in      #
+#                            LogfileMonitorMetrics.prom;                                          #
+#                          - Profile the first intervals of RUN mode with --profile <directory>,  #
+#                            cProfile & sampled stacks;                                           #
+#                          - Log level with -l, default is warning, the logs are written once by  #
+#                            a QueueListener thread;                                              #
+#                          - Count the occurrences in a sliding window across intervals and       #
+#                            restarts (window);                                                   #
 ###################################################################################################
 # Search the pattern from the monitored log file/s, and generate the output with defined format
 
 """
-import copy
+import collections
+import concurrent.futures
+import cProfile
+import ctypes
+import ctypes.util
+import hashlib
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import pstats
+import queue
 import re
+import select
+import signal
+import struct
 import sys
 import time
-import subprocess
 import yaml
 
-VERSION = "1.1 20190628"
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    # Python 3.11+
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+VERSION = "1.2 20261018"
 
 SCRIPT_NAME = os.path.basename(__file__)
 
@@ -60,6 +128,81 @@ RUN_OUTPUT_FORMAT = {
 # Set the interval for RUN mode, unit is second
 SCRIPT_INTERVAL_RUN = 5
 
+# Set the delay to collect more changes after a logfile is changed with "-w inotify", unit is second
+INOTIFY_DELAY = 0.2
+
+# Set the number of the first bytes of logfile to recognise it while it is rotated or trimmed
+FINGERPRINT_SIZE = 1024
+
+# Set the number of lines to compact the checkpoint file (LogfileMonitor.loc) at least
+CHECKPOINT_COMPACT_LINES = 1000
+
+# Set the size of block to read the logfile, unit is byte
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Set the minimal length of the required literal of regexp pattern to search it at first
+REQUIRED_LITERAL_SIZE = 3
+
+# Set the default maximal number of distinct matched contents for a pattern per interval (maxdistinct)
+MAX_DISTINCT_HITS = 1000
+
+# Set the default maximal bytes and lines to read from a logfile per interval for "readtype: incremental"
+# (maxbytes, maxlines), 0 for no limit, the left lines are read in the next intervals
+MAX_READ_BYTES = 64 * 1024 * 1024
+MAX_READ_LINES = 0
+
+# Set the maximal time to read the logfiles per interval in RUN mode, 0 for no limit, unit is second
+# The left logfiles are read at first in the next interval
+CYCLE_TIME_BUDGET = 60
+
+# Set the number of buckets of the sliding window to count the occurrences (window) for "readtype: incremental",
+# the hits are expired by the buckets of window / OCCURRENCE_WINDOW_BUCKETS seconds
+OCCURRENCE_WINDOW_BUCKETS = 10
+
+# Set the default minimal interval to read a logfile in RUN mode (pollmin), unit is second
+# With pollmax, the interval is doubled while the logfile is not changed, and reset to pollmin once it is changed,
+# the default pollmax is pollmin, so the interval is not backed off unless pollmax is set
+POLL_INTERVAL_MIN = SCRIPT_INTERVAL_RUN
+
+# Set the minimal interval to write the metrics file of RUN mode, E.g LogfileMonitorMetrics.prom, unit is second
+METRICS_INTERVAL = 15
+
+# Set the sample rate of the timers per pattern, the patterns are timed for 1 of every N searched lines
+METRICS_SAMPLE_RATE = 64
+
+# Set the default number of intervals to profile with "--profile <directory>" in RUN mode (--profile-cycles)
+PROFILE_CYCLES = 10
+
+# Set the interval of the sampling profiler with "--profile", unit is second of CPU time
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Set the number of top functions in the summary of "--profile"
+PROFILE_TOP_FUNCTIONS = 30
+
+# Set if the output file of RUN mode is synchronized to disk after every write, y/n
+OUT_FILE_FSYNC = "n"
+
+# The data to be appended to the output file of RUN mode
+OUT_BUFFER = []
+
+# Set the default format of the output file of RUN mode, yaml or jsonl
+OUT_FORMAT = "yaml"
+
+# Set the maximal size of the output file of RUN mode to rotate it by READ mode, with 1 backup
+OUT_FILE_MAX_SIZE = 1 * 1024 * 1024
+
+# The cached files of the directories of logfiles, refreshed only if the mtime of directory is changed
+# directory: [mtime, time of listing, list of files, {regexp of logfilename: list of matched logfilenames}]
+LOGFILE_DIR_CACHE = {}
+
+# The worker processes to scan the logfiles with "-j <workers>", and the number of them
+WORKER_POOL = None
+WORKER_NUMBER = 1
+
+# Use the faster YAML dumper of LibYAML if it is available
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # Set Return code & description
 RETURN_CODE_DESC = [
     {"rc": "0", "desc": "Successful"},
@@ -87,29 +230,71 @@ READ_OUTPUT_FORMAT = {
 # # Set default file of READ mode
 # OUT_FILE = os.path.join(WORKING_DIR, "LogfileMonitorOut.yml")
 
-# Set debugging or not
-DEBUG = "1"
+# Set the log file, it is rotated with 2 backups
+LOG_FILE = '/tmp/%s' % SCRIPT_NAME.replace(".py", ".log")
+LOG_FILE_MAX_SIZE = 2 * 1024 * 1024
+
+# Set the default log level: debug/info/warning/error (-l)
+LOG_LEVEL = "warning"
+
+# The thread to write the logs to LOG_FILE, see setup_logging
+LOG_LISTENER = None
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Put the log records into the queue, they are written to LOG_FILE by the thread of LOG_LISTENER
+    The thread is not running in the worker processes forked with "-j <workers>", the records are written there
+    """
+
+    def __init__(self, log_queue, handler):
+        """
+        :param log_queue: The queue of LOG_LISTENER
+        :param handler: The handler to write LOG_FILE
+        """
+        QueueHandler.__init__(self, log_queue)
+        self.handler = handler
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            QueueHandler.emit(self, record)
+        else:
+            self.handler.handle(record)
+
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    Write the logs to LOG_FILE by a background thread, so the search is not blocked by writing them
+    It replaces the handlers of the root logger, every record is written once
+    :param level: debug/info/warning/error
+    : Global: LOG_LISTENER
+    :return:
+    """
+    global LOG_LISTENER
+
+    # 20190528-XJS : 1.0
+    handler = RotatingFileHandler(filename=LOG_FILE, maxBytes=LOG_FILE_MAX_SIZE, backupCount=2)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
-if DEBUG == "1":
-    logging.basicConfig(filename='/tmp/%s' % SCRIPT_NAME.replace(".py", ".log"),
-                        level=logging.DEBUG,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
-else:
-    logging.basicConfig(filename='/tmp/%s' % SCRIPT_NAME.replace(".py", ".log"),
-                        level=logging.WARNING,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if LOG_LISTENER:
+        LOG_LISTENER.stop()
+    log_queue = queue.Queue(-1)
+    LOG_LISTENER = QueueListener(log_queue, handler)
+    LOG_LISTENER.start()
 
-# 20190528-XJS : 1.0
-Rhandler = RotatingFileHandler(filename='/tmp/%s' % SCRIPT_NAME.replace(".py", ".log"),
-                               maxBytes=2 * 1024 * 1024,
-                               backupCount=2)
-logging.getLogger('').addHandler(Rhandler)
-logging.getLogger()
+    logger = logging.getLogger()
+    for item in list(logger.handlers):
+        logger.removeHandler(item)
+    logger.addHandler(LogQueueHandler(log_queue, handler))
+    logger.setLevel(level.upper())
 
 
 def usage():
     print("Usage is:")
-    print("          %s -m {run | read} -p <Parameter file> [-o <Output file>]" % SCRIPT_NAME)
+    print("          %s -m {run | read} -p <Parameter file> [-o <Output file>] [-f {yaml | jsonl}] [-w {poll | inotify}]"
+          " [-j <workers>] [-l {debug | info | warning | error}] [--profile <directory> [--profile-cycles <intervals>]]"
+          % SCRIPT_NAME)
     print("      or: %s -v" % SCRIPT_NAME)
     print("      or: %s -h" % SCRIPT_NAME)
     print("")
@@ -118,6 +303,23 @@ def usage():
         "    -p <Parameter file>  Required, the FULL path of parameter file, e.g /home/em7admin/LogfileMonitorPara.yml")
     print(
         '    -o <Output file>  Optional, the output file, default is LogfileMonitorOut.yml with the same directory of "-p"')
+    print(
+        '    -f {yaml | jsonl}  Optional, the format of output file, default is yaml; jsonl is appended only and '
+        'READ mode reads the new data from its cursor')
+    print(
+        '    -w {poll | inotify}  Optional, for RUN mode, default is poll every interval; inotify reads the logfiles '
+        'while they are changed (Linux only)')
+    print(
+        '    -j <workers>  Optional, for RUN mode, the number of processes to scan the logfiles in parallel, '
+        'default is 1')
+    print(
+        '    -l {debug | info | warning | error}  Optional, the log level, default is %s, the logs are written to %s'
+        % (LOG_LEVEL, LOG_FILE))
+    print(
+        '    --profile <directory>  Optional, for RUN mode, profile the first intervals, and save the pstats of every '
+        'interval, the sampled stacks for flamegraph and the summary of top functions into the directory')
+    print(
+        '    --profile-cycles <intervals>  Optional, the number of intervals to profile, default is %d' % PROFILE_CYCLES)
     print("    -v  Show the current version information")
     print("    -h  Show the usage of the script")
 
@@ -160,7 +362,7 @@ def get_from_yaml(file):
     logging.info("Capture the data from file: (%s)" % file)
     try:
         with open(file) as f:
-            filed = yaml.load(f)
+            filed = yaml.load(f, Loader=YAML_LOADER)
     except IOError:
         logging.error("File access error: %s" % file)
 
@@ -172,58 +374,78 @@ def get_from_yaml(file):
     return filed
 
 
+def expand_logfilename(dir_exp, file_exp):
+    """
+    Get the exact logfilenames in the directory from the regexp of logfilename, with LOGFILE_DIR_CACHE
+    The files of directory are listed again only if its mtime is changed, or it was changed while it was listed
+    :param dir_exp: The directory of logfiles
+    :param file_exp: The regexp of logfilename
+    :return: A list of exact logfilenames with the directory
+    """
+    mtime = os.stat(dir_exp).st_mtime_ns
+    cache = LOGFILE_DIR_CACHE.get(dir_exp)
+    if cache is None or cache[0] != mtime or cache[1] <= mtime + 1000000000:
+        now = time.time() * 1000000000
+        files = [f for f in os.listdir(dir_exp) if os.path.isfile(os.path.join(dir_exp, f))]
+        cache = LOGFILE_DIR_CACHE[dir_exp] = [mtime, now, files, {}]
+
+    matched_files = cache[3].get(file_exp)
+    if matched_files is None:
+        regexp = re.compile(file_exp)
+        matched_files = []
+        for f in cache[2]:
+            # check with expr
+            res = regexp.match(f)
+            if res:
+                matched_files.append(os.path.join(dir_exp, res.group(0)))
+        # The rotated files match the same part, E.g app.log for app.log.1 and app.log-20261018
+        matched_files = list(collections.OrderedDict.fromkeys(matched_files))
+        cache[3][file_exp] = matched_files
+
+    return matched_files
+
+
 def trans_pattern_logfile(mylist_1):
     """
     Translate the search pattern to the exact logfilename/s from the regexp if have
-    :param mylist_1:
-    :return: mylist_2
+    :param mylist_1: The search patterns (PatternRule)
+    :return: mylist_2, a list of (exact logfilename, search pattern)
     """
-    global OUT_ITEM_SAMPLE
-
-    logging.debug("To be translated search pattern with regexp logfilenames:")
-    # for i in range(len(mylist_1)):
-    #     logging.debug(mylist_1[i])
-    for item in mylist_1:
-        logging.debug(item)
+    # It is run every interval, the patterns are listed only for debugging
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if debug:
+        logging.debug("To be translated search pattern with regexp logfilenames:")
+        for item in mylist_1:
+            logging.debug(item)
     mylist_2 = []
+    # The exact logfilenames of every logfilename regexp, it is expanded once for all the search patterns
+    expanded = {}
 
-    for i in range(len(mylist_1)):
-        match_yn = False
-        # Save the item of pattern search for logfilename regexp
-        item_logfilename = copy.deepcopy(mylist_1[i])
-
+    for rule in mylist_1:
         # Get the filename and dir name
-        logging.debug("logfilename regexp is: %s" % item_logfilename["logfilename"])
-
-        file_exp = os.path.basename(item_logfilename["logfilename"])
-        dir_exp = os.path.dirname(item_logfilename["logfilename"]) \
-            if os.path.dirname(item_logfilename["logfilename"]) else "./"
-
-        for f in os.listdir(dir_exp):
-            file = os.path.join(dir_exp, f)
-            if os.path.isfile(file):
-                # check with expr
-                res = re.match(file_exp, f)
-                if res:
-                    match_yn = True
-                    matched_file = os.path.join(dir_exp, res.group(0))
+        if debug:
+            logging.debug("logfilename regexp is: %s", rule.logfilename)
 
-                    logging.debug("Matched file: %s" % matched_file)
+        if rule.logfilename not in expanded:
+            file_exp = os.path.basename(rule.logfilename)
+            dir_exp = os.path.dirname(rule.logfilename) if os.path.dirname(rule.logfilename) else "./"
+            expanded[rule.logfilename] = expand_logfilename(dir_exp, file_exp)
 
-                    # Update and/or Add logfilename
-                    item_logfilename["logfilename"] = matched_file
-                    # Append it
+        for matched_file in expanded[rule.logfilename]:
+            if debug:
+                logging.debug("Matched file: %s", matched_file)
 
-                    mylist_2.append(copy.deepcopy(item_logfilename))
-        if not match_yn:
+            # Append it with the exact logfilename
+            mylist_2.append((matched_file, rule))
+        if not expanded[rule.logfilename]:
             RC = 21
-            logging.error("No matched logfile for: %s" % item_logfilename["logfilename"])
+            logging.error("No matched logfile for: %s" % rule.logfilename)
             # write the wrong message to output
 
-            OUT_ITEM_SAMPLE = copy.deepcopy(item_logfilename)
+            out_item = dict(rule.entry)
             # set the return code for "NO MATCHED LOGFILE FOUND"
-            OUT_ITEM_SAMPLE["rc"] = RC
-            write_data_outfile(OUT_ITEM_SAMPLE)
+            out_item["rc"] = RC
+            write_data_outfile(out_item)
 
     return mylist_2
 
@@ -235,19 +457,21 @@ def trans_param_pattern(mylist_1, mylist_2):
     :param mylist_2:
     :return: mylist_2
     """
-    logging.debug("To be translated data:")
-    for i in range(len(mylist_1)):
-        logging.debug(mylist_1[i])
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if debug:
+        logging.debug("To be translated data:")
+        for i in range(len(mylist_1)):
+            logging.debug(mylist_1[i])
 
     for i in range(len(mylist_1)):
-        item = copy.deepcopy(mylist_1[i])
+        item = mylist_1[i]
         mydict = {}
         for k in item.keys():
             if k != "patternmatch":
                 mydict[k] = item[k]
 
         for j in range(len(item["patternmatch"])):
-            mydict2 = copy.deepcopy(mydict)
+            mydict2 = dict(mydict)
 
             pattern = item["patternmatch"][j]
             for k in pattern.keys():
@@ -256,19 +480,1615 @@ def trans_param_pattern(mylist_1, mylist_2):
             # Append the data into mylist_2
             mylist_2.append(mydict2)
 
-    logging.debug("translated data:")
-    for i in range(len(mylist_2)):
-        logging.debug(mylist_2[i])
+    if debug:
+        logging.debug("translated data:")
+        for i in range(len(mylist_2)):
+            logging.debug(mylist_2[i])
 
     return mylist_2
 
 
+class PatternRule(object):
+    """
+    The search pattern compiled from the translated parameters, it is created once while the parameter file is loaded
+    The regexps are compiled, the patternsearchtype is dispatched to a bound matcher, and the fixed fields of
+    the output are generated in advance
+    """
+    __slots__ = ("entry", "logicalname", "logfilename", "search_type", "search_str", "read_type", "deduplicate",
+                 "occurrences", "max_distinct", "poll_min", "poll_max", "regexp", "literal", "logfield1", "logfield2",
+                 "out_item", "resource", "match", "result_key", "max_bytes", "max_lines", "window")
+
+    def __init__(self, entry):
+        """
+        :param entry: The translated parameters of a pattern, see trans_param_pattern
+        """
+        self.entry = entry
+        self.logicalname = entry["logicalname"]
+        self.logfilename = entry["logfilename"]  # regexp of logfilename
+        self.search_type = entry.get("patternsearchtype", "substring").lower()
+        self.search_str = entry["patternsearch"]
+        self.read_type = entry["readtype"].lower()  # incremental/full
+        self.deduplicate = entry["deduplicate"].lower() == "y"
+        # REQ13
+        self.occurrences = int(entry.get("occurrences", 1))
+        self.max_distinct = int(entry.get("maxdistinct", MAX_DISTINCT_HITS))
+        self.poll_min = int(entry.get("pollmin", POLL_INTERVAL_MIN))
+        self.poll_max = max(int(entry.get("pollmax", self.poll_min)), self.poll_min)
+        self.max_bytes = int(entry.get("maxbytes", MAX_READ_BYTES))
+        self.max_lines = int(entry.get("maxlines", MAX_READ_LINES))
+        # The occurrences are counted in the sliding window of seconds across the intervals, 0 for an interval
+        self.window = int(entry.get("window", 0)) if self.read_type == "incremental" else 0
+        # The cached result of "readtype: full" is used only if the matched contents are searched in the same way
+        self.result_key = (self.search_type, self.search_str, self.deduplicate, self.max_distinct)
+
+        self.regexp = re.compile(self.search_str) if self.search_type == "regexp" else None
+        # The literal which is required by the regexp, the regexp is searched only if it is in the line
+        self.literal = get_required_literal(self.regexp) if self.regexp else ""
+        # REQ15: extract fields for logfield1, logfield2 from matched entries
+        self.logfield1 = re.compile(entry["logfield1"]) if entry.get("logfield1") else None
+        self.logfield2 = re.compile(entry["logfield2"]) if entry.get("logfield2") else None
+
+        self.match = {"regexp": self.match_regexp,
+                      "starts with": self.match_starts_with,
+                      "ends with": self.match_ends_with,
+                      "substring": self.match_substring,
+                      "full": self.match_full}[self.search_type]
+
+        # Update the output contents if there is relevant item from parameter file
+        self.out_item = {}
+        for k in OUT_ITEM_SAMPLE.keys():
+            self.out_item[k] = entry[k] if entry.get(k) else OUT_ITEM_SAMPLE[k]
+        self.out_item["logeventtype"] = entry["eventtype"]
+        self.out_item["responsible"] = entry.get("responsible", "")
+        # Set default rc & rcdesc
+        if self.out_item["rc"] == '':
+            self.out_item["rc"] = 0
+        # The resource is combined with: instance:logfilename:eventtype:logfield1:logfield2
+        self.resource = "%s:%%s:%s:%%s:%%s" % (entry.get("instance", ""), entry.get("eventtype", ""))
+
+    def __repr__(self):
+        return "PatternRule(%r)" % self.entry
+
+    def match_regexp(self, line):
+        """
+        Search the pattern from the line's content
+        :param line: The line's content without the line break
+        :return: The matched contents, or None if it is not matched
+        """
+        if self.literal not in line:
+            return None
+        matched_str = self.regexp.search(line)
+        if matched_str:
+            return matched_str.group(0)
+        return None
+
+    def match_starts_with(self, line):
+        if line.startswith(self.search_str):
+            return self.search_str
+        return None
+
+    def match_ends_with(self, line):
+        if line.endswith(self.search_str):
+            return self.search_str
+        return None
+
+    def match_substring(self, line):
+        if self.search_str in line:
+            return self.search_str
+        return None
+
+    def match_full(self, line):
+        if line == self.search_str:
+            return self.search_str
+        return None
+
+    def get_out_item(self, logfilename, matched_contents, num):
+        """
+        Generate the output for the matched contents
+        :param logfilename: exact logfile name with path
+        :param matched_contents: The matched contents
+        :param num: The number of hits
+        :return: out_item
+        """
+        out_item = dict(self.out_item)
+        out_item["logfilename"] = logfilename
+        out_item["actualnumberofhits"] = num  # Update the number of hits
+        out_item["message"] = matched_contents
+
+        # REQ15: Get values for logfield1 & 2 from matched contents
+        out_item["logfield1"] = ''
+        if self.logfield1:
+            res = self.logfield1.search(matched_contents)
+            if res:
+                out_item["logfield1"] = res.group()
+
+        out_item["logfield2"] = ''
+        if self.logfield2:
+            res = self.logfield2.search(matched_contents)
+            if res:
+                out_item["logfield2"] = res.group()
+
+        # Update the output contents with combination
+        out_item["resource"] = self.resource % (logfilename, out_item["logfield1"], out_item["logfield2"])
+
+        return out_item
+
+
+def get_required_literal(regexp):
+    """
+    Extract the longest literal which is required by every match of the regexp,
+    E.g "pam_unix(sshd:session): session " for: pam_unix\\(sshd:session\\): session (closed|opened)
+    :param regexp: The compiled regexp
+    :return: The literal, or "" if there is not any literal as long as REQUIRED_LITERAL_SIZE
+    """
+    if regexp.flags & re.IGNORECASE:
+        return ""
+    try:
+        parsed = sre_parse.parse(regexp.pattern, regexp.flags)
+    except Exception:
+        return ""
+
+    literals = []
+
+    def walk(items):
+        # The consecutive literals, all the items are required except alternation and optional repeat
+        run = []
+        for op, av in items:
+            if op == sre_constants.LITERAL:
+                run.append(chr(av))
+                continue
+            literals.append("".join(run))
+            run = []
+            if op == sre_constants.SUBPATTERN:
+                # av is (group, add_flags, del_flags, pattern), or (group, pattern) for Python 3.5
+                if len(av) == 4 and av[1] & re.IGNORECASE:
+                    continue
+                walk(av[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                walk(av[2])
+        literals.append("".join(run))
+
+    walk(parsed)
+    literal = max(literals, key=len)
+
+    return literal if len(literal) >= REQUIRED_LITERAL_SIZE else ""
+
+
+def build_trie_regexp(literals):
+    """
+    Build the regexp with alternation of the literals, which is factorised as a trie
+    E.g ["error", "err", "fail"] is built as: (?:err(?:or)?|fail)
+    The greedy regexp matches the longest literal at a position
+    :param literals: The literals (not empty)
+    :return: The regexp string
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for ch in literal:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # The end of a literal
+
+    def trie_to_regexp(node):
+        branches = [re.escape(ch) + trie_to_regexp(node[ch]) for ch in sorted(node.keys()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        regexp = "(?:%s)" % "|".join(branches)
+        # The literal can be ended here, but the longer one is preferred
+        return regexp + "?" if "" in node else regexp
+
+    return trie_to_regexp(trie)
+
+
+class LogfileMatcher(object):
+    """
+    Search all the patterns of a logfile from a line in a single pass
+    The literal patterns (starts with/ends with/substring/full) are combined into one regexp, which reports the
+    longest literal at every position where any literal starts, the shorter literals are its prefixes
+    The regexp patterns are searched only from the lines with their required literal, which is combined as well
+    The searched lines and the evaluations of every regexp are counted, and the regexps are timed for 1 of every
+    METRICS_SAMPLE_RATE lines
+    """
+    __slots__ = ("rules", "literal_prefilter", "literal_regexp", "literal_prefixes", "regexp_rules", "bytes_prefilter",
+                 "searched_lines", "evaluations", "sampled_seconds")
+
+    def __init__(self, rules):
+        """
+        :param rules: The search patterns (PatternRule) of the logfile
+        """
+        self.rules = rules
+        self.searched_lines = 0
+        self.evaluations = [0] * len(rules)
+        self.sampled_seconds = [0.0] * len(rules)
+        literal_rules = {}
+        self.regexp_rules = []
+        for i in range(len(rules)):
+            rule = rules[i]
+            if rule.search_type != "regexp" and rule.search_str:
+                literal_rules.setdefault(rule.search_str, []).append((i, rule.search_type))
+            elif rule.search_type == "regexp" and rule.literal:
+                literal_rules.setdefault(rule.literal, []).append((i, rule.search_type))
+            else:
+                self.regexp_rules.append((i, rule.match))
+
+        self.literal_prefilter = None
+        self.literal_regexp = None
+        self.literal_prefixes = {}
+        if literal_rules:
+            regexp = build_trie_regexp(literal_rules.keys())
+            self.literal_prefilter = re.compile(regexp)
+            self.literal_regexp = re.compile("(?=(%s))" % regexp)
+            # The patterns of every literal, and the literals which are its prefixes
+            for literal in literal_rules.keys():
+                self.literal_prefixes[literal] = [(len(prefix), literal_rules[prefix])
+                                                  for prefix in literal_rules.keys() if literal.startswith(prefix)]
+
+        # The literals to search from the bytes of logfile, only if every pattern has a literal,
+        # and any of them is not the replacement character of undecodable bytes
+        self.bytes_prefilter = None
+        if literal_rules and not self.regexp_rules and not any("\ufffd" in literal for literal in literal_rules):
+            self.bytes_prefilter = re.compile(regexp.encode("utf-8"))
+
+    def match(self, line):
+        """
+        Search all the patterns from the line's content
+        :param line: The line's content without the line break
+        :return: [(index of pattern, matched contents)]
+        """
+        self.searched_lines += 1
+        timer = None if self.searched_lines % METRICS_SAMPLE_RATE else time.perf_counter
+        hits = ()
+        if self.literal_prefilter is not None:
+            res = self.literal_prefilter.search(line)
+            if res:
+                hits = []
+                done = set()
+                line_len = len(line)
+                for res in self.literal_regexp.finditer(line, res.start()):
+                    pos = res.start()
+                    for literal_len, patterns in self.literal_prefixes[res.group(1)]:
+                        for i, search_type in patterns:
+                            if i in done:
+                                continue
+                            if search_type == "regexp":
+                                # The required literal is found, search the regexp
+                                done.add(i)
+                                self.evaluations[i] += 1
+                                if timer:
+                                    start = timer()
+                                matched_str = self.rules[i].regexp.search(line)
+                                if timer:
+                                    self.sampled_seconds[i] += timer() - start
+                                if matched_str:
+                                    hits.append((i, matched_str.group(0)))
+                            elif search_type == "substring" \
+                                    or (search_type == "starts with" and pos == 0) \
+                                    or (search_type == "ends with" and pos + literal_len == line_len) \
+                                    or (search_type == "full" and pos == 0 and literal_len == line_len):
+                                done.add(i)
+                                hits.append((i, self.rules[i].search_str))
+
+        for i, match in self.regexp_rules:
+            if timer:
+                start = timer()
+            matched_contents = match(line)
+            if timer:
+                self.sampled_seconds[i] += timer() - start
+            if matched_contents is not None:
+                if not hits:
+                    hits = []
+                hits.append((i, matched_contents))
+
+        return hits
+
+    def get_costs(self):
+        """
+        :return: [(evaluations, seconds)] for every pattern, the seconds are estimated from the sampled timers
+        """
+        evaluations = list(self.evaluations)
+        for i, match in self.regexp_rules:
+            evaluations[i] += self.searched_lines
+        return [(evaluations[i], self.sampled_seconds[i] * METRICS_SAMPLE_RATE) for i in range(len(self.rules))]
+
+
+def compile_param_pattern(mylist_pattern):
+    """
+    Compile the translated parameters to the search patterns
+    :param mylist_pattern: The translated parameters of every pattern
+    :return: mylist_rule, the list of PatternRule
+    """
+    mylist_rule = []
+    for item in mylist_pattern:
+        mylist_rule.append(PatternRule(item))
+
+    return mylist_rule
+
+
+class ParamConfig(object):
+    """
+    The search patterns compiled from the parameter file (e.g LogfileMonitorParam.yml), kept for RUN mode
+    The file is loaded again only if its mtime/size and content (SHA1) are changed, or on SIGHUP,
+    and the last good search patterns are kept if it is invalid
+    """
+    __slots__ = ("filename", "stat", "digest", "rules", "reload_requested")
+
+    def __init__(self, filename):
+        """
+        :param filename: The parameter file
+        """
+        self.filename = filename
+        self.stat = None
+        self.digest = None
+        self.rules = None
+        self.reload_requested = False
+
+    def request_reload(self, signum=None, frame=None):
+        """
+        Load the parameter file again in next interval, as the handler of SIGHUP
+        :param signum:
+        :param frame:
+        :return:
+        """
+        self.reload_requested = True
+
+    def get_rules(self):
+        """
+        Get the search patterns, which are loaded again only if the parameter file is changed
+        :return: mylist_rule, the list of PatternRule
+        """
+        try:
+            stat = os.stat(self.filename)
+            stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stat = None
+
+        if self.rules is not None and stat == self.stat and stat is not None and not self.reload_requested:
+            return self.rules
+
+        self.stat = stat
+        reload_requested = self.reload_requested
+        self.reload_requested = False
+
+        data = None
+        try:
+            with open(self.filename, "rb") as f:
+                data = f.read()
+        except IOError:
+            pass
+
+        digest = hashlib.sha1(data).hexdigest() if data is not None else None
+        if self.rules is not None and digest == self.digest and not reload_requested:
+            return self.rules
+
+        try:
+            mylist_rule = self.load(data)
+        except (SystemExit, Exception) as e:
+            if self.rules is None:
+                raise
+            logging.error("Failed to load the parameter file: %s, keep the last good one: %s" % (self.filename, e))
+        else:
+            if self.rules is not None:
+                logging.info("Loaded the changed parameter file: %s" % self.filename)
+            self.rules = mylist_rule
+
+        # The changed file is not loaded again till it is changed again, even if it is invalid
+        self.digest = digest
+
+        return self.rules
+
+    def load(self, data):
+        """
+        Parse, check and compile the parameter file
+        :param data: The content of parameter file, None if it can not be read
+        :return: mylist_rule, the list of PatternRule
+        """
+        # Get parameters from file
+        logging.info("Capture the data from file: (%s)" % self.filename)
+        if data is None:
+            logging.error("File access error: %s" % self.filename)
+
+            RC = 1
+            OUT_ITEM_SAMPLE["rc"] = RC
+            write_data_outfile(OUT_ITEM_SAMPLE)  # Append the data into output file
+            OUT_ITEM_SAMPLE["rc"] = ""
+
+            mylist_param = {}
+        else:
+            mylist_param = yaml.load(data, Loader=YAML_LOADER)
+        logging.debug("data for parameter file:\n %s", mylist_param)
+        # Check if the YAML file is valid (list data type)
+        valid_yaml_format(self.filename, mylist_param, "list")
+
+        # Check if the parameters are valid
+        for i in range(len(mylist_param)):
+            valid_para_config_file(mylist_param[i])
+
+        # Translate the parameters to every patternsearch
+        mylist_pattern = []
+        mylist_pattern = trans_param_pattern(mylist_param, mylist_pattern)
+        # Add default value into if it is missing in parameter file
+        for k in range(len(mylist_pattern)):
+            if mylist_pattern[k].get("ttl") == None:
+                mylist_pattern[k]["ttl"] = 99
+
+        # debugging: list out all the search patterns
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("data for patterns:\n%s", mylist_pattern)
+            logging.debug("All the search patterns with exact logfilename expresion:")
+            for i in range(len(mylist_pattern)):
+                logging.debug(mylist_pattern[i])
+
+        # Compile the search patterns
+        return compile_param_pattern(mylist_pattern)
+
+
+def group_pattern_logfile(mylist_logfile):
+    """
+    Group the search patterns by the exact logfilename, across all the logicalnames pointing to the same logfile
+    :param mylist_logfile: The list of (exact logfilename, search pattern)
+    :return: mylist, a list of (logfilename, [search patterns]) in the order of the first appearance
+    """
+    mylist = []
+    index = {}
+    for logfilename, rule in mylist_logfile:
+        if logfilename not in index:
+            index[logfilename] = len(mylist)
+            mylist.append((logfilename, []))
+        mylist[index[logfilename]][1].append(rule)
+
+    return mylist
+
+
+def parse_last_checked_line(line):
+    """
+    Parse a line of LAST_CHECKED_LINE to the checkpoint of logicalname & logfilename
+    :param line: The line with the columns:
+                 logicalname logfilename last_number file_size [offset [device inode fingerprint]]
+    :return: checkpoint (dict), or None if there are not so many fields
+             offset is None for the entry with the former 4 columns format, it has to be migrated
+    """
+    fields = line.split()
+    if len(fields) < 4:
+        return None
+
+    checkpoint = dict(logicalname=fields[0], logfilename=fields[1], last_number=int(fields[2]),
+                      file_size=int(fields[3]), offset=None, device=0, inode=0, fingerprint="")
+    # The byte offset is added as the 5th column
+    if len(fields) >= 5:
+        checkpoint["offset"] = int(fields[4])
+    # The identity of logfile is added as the 6th ~ 8th columns
+    if len(fields) >= 8:
+        checkpoint["device"] = int(fields[5])
+        checkpoint["inode"] = int(fields[6])
+        checkpoint["fingerprint"] = fields[7]
+
+    return checkpoint
+
+
+def format_last_checked_line(item):
+    """
+    Format the line of LAST_CHECKED_LINE for a checkpoint of last_line_list
+    :param item: The checkpoint (dict), see parse_last_checked_line
+    :return: The line with the columns: logicalname logfilename last_number file_size offset device inode fingerprint
+    """
+    return "%s  %s  %d  %d  %d  %d  %d  %s\n" % (item["logicalname"], item["logfilename"], item["last_number"],
+                                               item["file_size"], item["offset"], item["device"], item["inode"],
+                                               item["fingerprint"])
+
+
+class CheckpointStore(object):
+    """
+    The checkpoints of every logicalname & logfilename, which are saved in LAST_CHECKED_LINE
+    The file is loaded once, and it is an append-only journal: the changed checkpoints are appended with one write
+    per interval, the latest line wins while loading, and it is compacted with an atomic rename
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.checkpoints = collections.OrderedDict()
+        self.changed = collections.OrderedDict()
+        self.journal_lines = 0
+        self.load()
+
+    def load(self):
+        """
+        Load all the checkpoints from the file into memory
+        :return:
+        """
+        self.checkpoints.clear()
+        self.journal_lines = 0
+        broken = False
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'r') as f:
+                for line in f:
+                    checkpoint = None
+                    if line.endswith("\n"):
+                        # The last line is not completed while the journal was interrupted
+                        try:
+                            checkpoint = parse_last_checked_line(line)
+                        except ValueError:
+                            pass
+                    if checkpoint:
+                        self.checkpoints[(checkpoint["logicalname"], checkpoint["logfilename"])] = checkpoint
+                        self.journal_lines += 1
+                    else:
+                        logging.warning("Invalid line in file: %s: %s" % (self.filename, line.strip()))
+                        broken = True
+        if broken:
+            self.compact()
+
+    def get(self, logicalname, logfilename):
+        """
+        Get the checkpoint for logicalname & logfilename
+        :param logicalname:
+        :param logfilename:
+        :return: checkpoint (dict), see parse_last_checked_line
+        """
+        checkpoint = self.checkpoints.get((logicalname, logfilename))
+        if checkpoint:
+            return dict(checkpoint)
+        return dict(logicalname=logicalname, logfilename=logfilename, last_number=0, file_size=0, offset=0,
+                    device=0, inode=0, fingerprint="")
+
+    def get_logfile(self, logfilename, logicalnames):
+        """
+        Get the checkpoints of the logfile for the logicalnames
+        :param logfilename:
+        :param logicalnames:
+        :return: {logicalname: checkpoint (dict)}
+        """
+        return dict((logicalname, self.get(logicalname, logfilename)) for logicalname in logicalnames)
+
+    def update(self, checkpoint):
+        """
+        Update the checkpoint in memory, it is saved by commit()
+        :param checkpoint:
+        :return:
+        """
+        key = (checkpoint["logicalname"], checkpoint["logfilename"])
+        if self.checkpoints.get(key) != checkpoint:
+            self.changed[key] = dict(checkpoint)
+
+    def commit(self):
+        """
+        Save the changed checkpoints to the file with one write
+        :return:
+        """
+        if not self.changed:
+            return
+
+        logging.debug("Update %d checkpoints to file: %s", len(self.changed), self.filename)
+        self.checkpoints.update(self.changed)
+        if self.journal_lines + len(self.changed) > max(2 * len(self.checkpoints), CHECKPOINT_COMPACT_LINES):
+            self.compact()
+        else:
+            data = "".join(format_last_checked_line(item) for item in self.changed.values())
+            with open(self.filename, 'a') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_lines += len(self.changed)
+        self.changed.clear()
+
+    def compact(self):
+        """
+        Rewrite the file with the latest checkpoints only, it is replaced atomically
+        :return:
+        """
+        logging.debug("Compact the file: %s", self.filename)
+        data = "logicalname     logfilename      0      0      0\n"
+        data += "".join(format_last_checked_line(item) for key, item in self.checkpoints.items()
+                        if key != ("logicalname", "logfilename"))
+        with open("%s-bak" % self.filename, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace("%s-bak" % self.filename, self.filename)
+        self.journal_lines = len(self.checkpoints)
+
+
+def skip_lines(f, last_number):
+    """
+    Skip the number of lines from the beginning of the file, to get the byte offset of the former checkpoint
+    :param f: The file opened in binary mode
+    :param last_number: The number of last checked line
+    :return: offset
+    """
+    f.seek(0)
+    for ii in range(0, last_number):
+        if not f.readline():
+            break
+    return f.tell()
+
+
+def get_fingerprint(f, size):
+    """
+    Get the fingerprint of the first bytes of the file, to recognise the file while it is rotated or trimmed
+    :param f: The file opened in binary mode
+    :param size: The number of bytes, it is limited by FINGERPRINT_SIZE
+    :return: The fingerprint like "<number of bytes>:<hash>"
+    """
+    f.seek(0)
+    data = f.read(min(size, FINGERPRINT_SIZE))
+    return "%d:%s" % (len(data), hashlib.sha1(data).hexdigest()[:16])
+
+
+def check_logfile_rotated(f, stat, checkpoint):
+    """
+    Check if the logfile is rotated or trimmed since the checkpoint
+    :param f: The logfile opened in binary mode
+    :param stat: os.stat() of the logfile
+    :param checkpoint: The checkpoint of logicalname & logfilename
+    :return: "rotated" if it is another file (inode), "trimmed" if it is trimmed or rewritten, or None
+    """
+    if checkpoint["inode"] and (checkpoint["device"], checkpoint["inode"]) != (stat.st_dev, stat.st_ino):
+        return "rotated"
+
+    # For REQ3, the logfile is trimmed while it is smaller than the checkpoint
+    if checkpoint["offset"] is None:
+        if stat.st_size < checkpoint["file_size"]:
+            return "trimmed"
+    elif stat.st_size < checkpoint["offset"]:
+        return "trimmed"
+
+    # The logfile is trimmed and written again while the first bytes are changed
+    if checkpoint["fingerprint"]:
+        size = int(checkpoint["fingerprint"].split(":")[0])
+        if get_fingerprint(f, size) != checkpoint["fingerprint"]:
+            return "trimmed"
+
+    return None
+
+
+def find_rotated_logfile(logfilename, checkpoint):
+    """
+    Find the rotated file (E.g messages.1) for the checkpoint of logfilename,
+    it is the same file (device & inode) with the checkpoint, or the copy (fingerprint) for "copytruncate"
+    :param logfilename: exact logfile name with path
+    :param checkpoint: The checkpoint of logicalname & logfilename
+    :return: The file name with path, or None if it is not found
+    """
+    if not checkpoint["fingerprint"]:
+        return None
+
+    dir_name = os.path.dirname(logfilename) if os.path.dirname(logfilename) else "./"
+    base_name = os.path.basename(logfilename)
+    for f in os.listdir(dir_name):
+        if f == base_name or not f.startswith(base_name):
+            continue
+        file = os.path.join(dir_name, f)
+        try:
+            stat = os.stat(file)
+            if (stat.st_dev, stat.st_ino) == (checkpoint["device"], checkpoint["inode"]):
+                return file
+            if stat.st_size >= checkpoint["offset"]:
+                with open(file, 'rb') as f2:
+                    size = int(checkpoint["fingerprint"].split(":")[0])
+                    if get_fingerprint(f2, size) == checkpoint["fingerprint"]:
+                        return file
+        except (IOError, OSError):
+            continue
+
+    return None
+
+
+class ScanStats(object):
+    """
+    The cost of reading a logfile once, collected by scan_logfile, and added to the metrics by RunMetrics
+    """
+    __slots__ = ("bytes_read", "lines_read", "read_seconds", "match_seconds", "searched_lines", "rule_costs",
+                 "lag_bytes")
+
+    def __init__(self):
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.read_seconds = 0.0
+        self.match_seconds = 0.0
+        # The lines which are decoded and searched for the patterns
+        self.searched_lines = 0
+        # [(evaluations, seconds)] for every pattern, see LogfileMatcher.get_costs
+        self.rule_costs = []
+        # The bytes which are not read with maxbytes/maxlines, the last line being written is not counted
+        self.lag_bytes = 0
+
+
+def search_lines(data, start, end, matcher, active, matched_list):
+    """
+    Search the patterns from the complete lines of the data
+    If every pattern has a literal, the literals are searched from the data in bytes, and only the lines with any of
+    them are decoded and searched, otherwise every line is decoded and searched
+    :param data: The bytes read from the logfile
+    :param start: The position of the first line in data
+    :param end: The position after the last line in data, with or without its line break
+    :param matcher: The patterns of the logfile (LogfileMatcher)
+    :param active: If the pattern is searched, for every pattern
+    :param matched_list: The matched contents for every pattern (HitCounter), the new ones are added
+    :return:
+    """
+    if matcher.bytes_prefilter is not None:
+        search = matcher.bytes_prefilter.search
+        res = search(data, start, end)
+        while res:
+            pos = res.start()
+            line_start = max(data.rfind(b"\n", start, pos) + 1, start)
+            line_end = data.find(b"\n", pos, end)
+            if line_end < 0:
+                line_end = end
+            line = data[line_start:line_end].decode("utf-8", "replace")
+            if line.endswith("\r"):
+                line = line[:-1]
+            for i, matched_contents in matcher.match(line):
+                if active[i]:
+                    matched_list[i].add(matched_contents)
+            res = search(data, line_end + 1, end)
+    else:
+        lines = data[start:end].split(b"\n")
+        if data.endswith(b"\n", start, end):
+            lines.pop()
+        for line in lines:
+            line = line.decode("utf-8", "replace")
+            if line.endswith("\r"):
+                line = line[:-1]
+            for i, matched_contents in matcher.match(line):
+                if active[i]:
+                    matched_list[i].add(matched_contents)
+
+
+def get_last_line_end(f, start, end):
+    """
+    Get the byte offset after the last line break of the logfile, between start and end
+    :param f: The logfile opened in binary mode
+    :param start:
+    :param end:
+    :return: The byte offset, or start if there is not any line break
+    """
+    pos = end
+    while pos > start:
+        size = min(READ_BLOCK_SIZE, pos - start)
+        f.seek(pos - size)
+        i = f.read(size).rfind(b"\n")
+        if i >= 0:
+            return pos - size + i + 1
+        pos -= size
+
+    return start
+
+
+def search_logfile_full(f, matcher, patterns, matched_list, stats, start, size):
+    """
+    Search the patterns of "readtype: full" from the byte offset to the end of logfile
+    The complete lines are searched at first, the matched contents till then are copied to be cached, and then the
+    last line without line break is searched
+    :param f: The logfile opened in binary mode
+    :param matcher: The patterns of the logfile (LogfileMatcher)
+    :param patterns: The index of patterns to be searched
+    :param matched_list: The matched contents for every pattern (HitCounter), the new ones are added
+    :param stats: The cost of reading the logfile (ScanStats), it is added
+    :param start: The byte offset of the first line to be searched
+    :param size: The size of logfile
+    :return: offset, counters
+             offset: The byte offset after the last complete line
+             counters: The copy of matched contents (HitCounter) of the patterns till the last complete line
+    """
+    end = get_last_line_end(f, start, size)
+    if end > start:
+        search_logfile_lines(f, matcher, [(start, patterns)], matched_list, stats, end)
+    counters = [matched_list[i].copy() for i in patterns]
+
+    if size > end:
+        # The last line which is being written, it is searched again in the next interval
+        active = [False] * len(matched_list)
+        for i in patterns:
+            active[i] = True
+        timer = time.perf_counter()
+        f.seek(end)
+        data = f.read(size - end)
+        stats.read_seconds += time.perf_counter() - timer
+        timer = time.perf_counter()
+        search_lines(data, 0, len(data), matcher, active, matched_list)
+        stats.match_seconds += time.perf_counter() - timer
+        stats.bytes_read += len(data)
+        stats.lines_read += 1
+
+    return end, counters
+
+
+def search_logfile_lines(f, matcher, readers, matched_list, stats, end_offset=None, max_bytes=0, max_lines=0,
+                         last_line=False):
+    """
+    Search the patterns of every reader from the lines of the logfile, every reader starts with its byte offset
+    The logfile is read with blocks of READ_BLOCK_SIZE, and the incomplete last line is kept for the next block,
+    the last line without line break at the end of logfile is being written, it is left to the next interval
+    :param f: The logfile opened in binary mode
+    :param matcher: The patterns of the logfile (LogfileMatcher)
+    :param readers: [(offset, [index of pattern])]
+    :param matched_list: The matched contents for every pattern (HitCounter), the new ones are added
+    :param stats: The cost of reading the logfile (ScanStats), it is added
+    :param end_offset: The byte offset to stop reading, None for the end of logfile
+    :param max_bytes: The maximal bytes to read, 0 for no limit, it is over only if there is not any complete line
+    :param max_lines: The maximal lines to read, 0 for no limit
+    :param last_line: Search the last line without line break as well, E.g of the rotated file
+    :return: offset, line_numbers, limited
+             offset: The byte offset after the last read line
+             line_numbers: The number of read lines for every reader
+             limited: True if it is stopped by maxbytes/maxlines
+    """
+    # The readers are activated in the order of their offset
+    pending = sorted(range(len(readers)), key=lambda i: readers[i][0], reverse=True)
+    active = [False] * len(matched_list)
+    start_numbers = [None] * len(readers)
+
+    # seek to the smallest offset, and search the patterns from every block
+    offset = readers[pending[-1]][0] if pending else 0
+    line_number = 0
+    f.seek(offset)
+    position = offset
+    first_offset = offset
+    data = b""
+    limited = False
+    while not limited:
+        size = READ_BLOCK_SIZE if end_offset is None else min(READ_BLOCK_SIZE, end_offset - position)
+        if max_bytes:
+            # Read more for the first complete line if it is over maxbytes
+            size = min(size, max_bytes - (position - first_offset) if position - first_offset < max_bytes else max_bytes)
+        timer = time.perf_counter()
+        block = f.read(size) if size > 0 else b""
+        stats.read_seconds += time.perf_counter() - timer
+        timer = time.perf_counter()
+        position += len(block)
+        data = data + block if data else block
+        # Search the complete lines, and the last line without line break at the end of the rotated file
+        end = data.rfind(b"\n") + 1 if block or not last_line else len(data)
+        start = 0
+        while start < end:
+            while pending and readers[pending[-1]][0] <= offset:
+                i = pending.pop()
+                start_numbers[i] = line_number
+                for j in readers[i][1]:
+                    active[j] = True
+
+            # Search till the line at or after the offset of next reader
+            stop = end
+            if pending and readers[pending[-1]][0] - offset < end - start:
+                stop = start + readers[pending[-1]][0] - offset
+                if data[stop - 1:stop] != b"\n":
+                    stop = data.find(b"\n", stop, end) + 1 or end
+
+            # Search till the last line within maxlines
+            if max_lines:
+                remaining = max_lines - line_number
+                if remaining <= 0:
+                    limited = True
+                    break
+                if block and data.count(b"\n", start, stop) > remaining:
+                    stop = start
+                    for k in range(remaining):
+                        stop = data.find(b"\n", stop, end) + 1
+
+            search_lines(data, start, stop, matcher, active, matched_list)
+            line_number += data.count(b"\n", start, stop) if block else 1
+            offset += stop - start
+            start = stop
+        stats.match_seconds += time.perf_counter() - timer
+        if not block:
+            break
+        data = data[end:]
+        if max_bytes and position - first_offset >= max_bytes and offset > first_offset:
+            # The incomplete last line is read in the next interval
+            limited = True
+
+    stats.bytes_read += position - first_offset
+    stats.lines_read += line_number
+    line_numbers = [line_number - i if i is not None else 0 for i in start_numbers]
+
+    return offset, line_numbers, limited
+
+
+def scan_logfile(logfilename, mylist_rule, logfile_checkpoints, logfile_results):
+    """
+    Read the logfile once, and search every line for all the patterns of the logfile
+    It only reads the logfile, so it can be run in a worker process with "-j <workers>"
+    :param logfilename: exact logfile name with path
+    :param mylist_rule: The search patterns (PatternRule) for the logfile, maybe from different logicalnames
+    :param logfile_checkpoints: The checkpoints of the logfile for every logicalname, see CheckpointStore.get_logfile
+    :param logfile_results: The cached results of the logfile for every logicalname with "readtype: full"
+    :return: matched_list, last_line_list, result_list, stats
+             matched_list: The matched contents for every search pattern (HitCounter)
+             last_line_list: The checkpoint of logicalname & logfilename for "readtype: incremental"
+             result_list: The result to be cached of logicalname & logfilename for "readtype: full"
+             stats: The cost of reading the logfile (ScanStats)
+    """
+    with open(logfilename, 'rb') as f:
+        stat = os.fstat(f.fileno())
+
+        # Get the checkpoint to start with for every logicalname,
+        # all the patterns of a logicalname share the same checkpoint
+        checkpoints = []
+        index = {}
+        rotated_list = []
+        for rule in mylist_rule:
+            logicalname = rule.logicalname
+            read_type = rule.read_type  # incremental/full
+            if (logicalname, read_type) in index:
+                continue
+
+            checkpoint = dict(logicalname=logicalname, logfilename=logfilename, last_number=0, file_size=0,
+                              offset=0, device=0, inode=0, fingerprint="")
+            if read_type == "incremental":
+                checkpoint = logfile_checkpoints[logicalname]
+                rotated = check_logfile_rotated(f, stat, checkpoint)
+                if rotated:
+                    logging.info("The logfile is %s: %s, check it from beginning for %s",
+                                 rotated, logfilename, logicalname)
+                    # The unread lines of the rotated file will be read at first
+                    rotated_list.append((len(checkpoints), dict(checkpoint)))
+                    checkpoint["last_number"] = 0
+                    checkpoint["offset"] = 0
+                    checkpoint["fingerprint"] = ""
+                elif checkpoint["offset"] is None:
+                    # Migrate the checkpoint with the former 4 columns format, by skipping the read lines once
+                    checkpoint["offset"] = skip_lines(f, checkpoint["last_number"])
+                    logging.info("Migrate the checkpoint of %s & %s to byte offset: %d",
+                                 logicalname, logfilename, checkpoint["offset"])
+            index[(logicalname, read_type)] = len(checkpoints)
+            checkpoints.append((read_type, checkpoint))
+
+        # The patterns of every checkpoint
+        readers = [(checkpoint["offset"], []) for read_type, checkpoint in checkpoints]
+        for i in range(len(mylist_rule)):
+            readers[index[(mylist_rule[i].logicalname, mylist_rule[i].read_type)]][1].append(i)
+        matcher = LogfileMatcher(mylist_rule)
+        matched_list = [HitCounter(rule) for rule in mylist_rule]
+        stats = ScanStats()
+
+        # Catch up with the unread lines of the rotated file
+        for i, checkpoint in rotated_list:
+            rotated_file = find_rotated_logfile(logfilename, checkpoint)
+            if rotated_file:
+                logging.info("Check the unread lines of the rotated file: %s from %d",
+                             rotated_file, checkpoint["offset"])
+                with open(rotated_file, 'rb') as f2:
+                    search_logfile_lines(f2, matcher, [(checkpoint["offset"], readers[i][1])], matched_list, stats,
+                                         last_line=True)
+            elif checkpoint["fingerprint"]:
+                logging.warning("The rotated file is not found for: %s, the unread lines are skipped", logfilename)
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Search the patterns in logfilename: %s, offsets to start with: %s",
+                          logfilename, [item[0] for item in readers])
+
+        # Search the patterns of "readtype: full", only from the appended lines with the cached result,
+        # or from the beginning if the logfile is rotated/trimmed or the patterns are changed
+        result_list = []
+        for i in range(len(checkpoints)):
+            read_type, checkpoint = checkpoints[i]
+            if read_type != "full":
+                continue
+            patterns = readers[i][1]
+            result_key = [mylist_rule[j].result_key for j in patterns]
+            result = logfile_results.get(checkpoint["logicalname"])
+            if result and result["result_key"] == result_key and not check_logfile_rotated(f, stat, result):
+                for j, counter in zip(patterns, result["counters"]):
+                    matched_list[j] = counter.copy()
+                start = result["offset"]
+            else:
+                start = 0
+
+            offset, counters = search_logfile_full(f, matcher, patterns, matched_list, stats, start, stat.st_size)
+            result_list.append(dict(logicalname=checkpoint["logicalname"], logfilename=logfilename,
+                                    file_size=stat.st_size, offset=offset, device=stat.st_dev, inode=stat.st_ino,
+                                    fingerprint=get_fingerprint(f, offset), result_key=result_key,
+                                    counters=counters))
+
+        # Search the patterns of "readtype: incremental" by lines
+        searched = [i for i in range(len(readers)) if checkpoints[i][0] == "incremental"]
+        offset, line_numbers = 0, [0] * len(readers)
+        if searched:
+            # Read at most maxbytes/maxlines per interval, the smallest ones of the patterns
+            incremental_rules = [rule for rule in mylist_rule if rule.read_type == "incremental"]
+            max_bytes = min([rule.max_bytes for rule in incremental_rules if rule.max_bytes] or [0])
+            max_lines = min([rule.max_lines for rule in incremental_rules if rule.max_lines] or [0])
+            offset, searched_numbers, limited = search_logfile_lines(f, matcher, [readers[i] for i in searched],
+                                                                     matched_list, stats, None, max_bytes, max_lines)
+            for i, line_number in zip(searched, searched_numbers):
+                line_numbers[i] = line_number
+            if limited:
+                stats.lag_bytes = max(stat.st_size - offset, 0)
+
+        # Save the checkpoint for every logicalname & logfilename, only when read_type is "incremental"
+        last_line_list = []
+        for i in range(len(checkpoints)):
+            read_type, checkpoint = checkpoints[i]
+            if read_type != "incremental":
+                continue
+            if line_numbers[i]:
+                checkpoint["last_number"] += line_numbers[i]
+                checkpoint["offset"] = offset
+            checkpoint["file_size"] = stat.st_size
+            checkpoint["device"] = stat.st_dev
+            checkpoint["inode"] = stat.st_ino
+            fingerprint_size = int(checkpoint["fingerprint"].split(":")[0]) if checkpoint["fingerprint"] else -1
+            if fingerprint_size < min(checkpoint["offset"], FINGERPRINT_SIZE):
+                checkpoint["fingerprint"] = get_fingerprint(f, checkpoint["offset"])
+            last_line_list.append(checkpoint)
+
+    stats.searched_lines = matcher.searched_lines
+    stats.rule_costs = matcher.get_costs()
+
+    return matched_list, last_line_list, result_list, stats
+
+
+def write_lag_file(lag_file, lagging):
+    """
+    Save the bytes which are not read yet for every logfile, the file is replaced only if it is changed
+    :param lag_file: The file to save, E.g LogfileMonitor.lag
+    :param lagging: {logfilename: lag bytes}
+    :return:
+    """
+    data = "".join("%s %d\n" % (logfilename, lagging[logfilename]) for logfilename in sorted(lagging))
+    try:
+        with open(lag_file, 'r') as f:
+            if f.read() == data:
+                return
+    except IOError:
+        if not data:
+            return
+
+    with open(lag_file + "-bak", 'w') as f:
+        f.write(data)
+    os.replace(lag_file + "-bak", lag_file)
+
+
+def format_metric_labels(labels):
+    """
+    Format the labels of a metric with Prometheus text format
+    :param labels: [(name, value)]
+    :return: E.g {logfile="/var/log/messages"}
+    """
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                          .replace("\n", "\\n")) for name, value in labels)
+
+
+class RunMetrics(object):
+    """
+    The counters and timers of RUN mode since it is started, for every logfile, search pattern and phase of
+    the interval, they are written to the metrics file (E.g LogfileMonitorMetrics.prom) with Prometheus text format
+    The phases are: expand, read, match, aggregate, write, checkpoint, the time of "read" and "match" is summed
+    from the logfiles, in the worker processes with "-j <workers>"
+    The counters of a pattern are for all of its logfiles, and its time is estimated from the sampled timers
+    """
+    PHASES = ["expand", "read", "match", "aggregate", "write", "checkpoint"]
+
+    def __init__(self):
+        self.cycles = 0
+        self.cycle_seconds = 0.0
+        self.phase_seconds = collections.OrderedDict((phase, 0.0) for phase in self.PHASES)
+        # {logfilename: [scans, bytes read, lines read, searched lines, read seconds, match seconds]}
+        self.files = {}
+        # {(logicalname, patternsearchtype, patternsearch): [evaluations, hits, events, seconds]}
+        self.rules = {}
+        # The time of last write, from time.monotonic()
+        self.written = None
+
+    def add_phase(self, phase, seconds):
+        """
+        :param phase: E.g expand
+        :param seconds: The time of the phase in an interval
+        :return:
+        """
+        self.phase_seconds[phase] += seconds
+
+    def add_scan(self, logfilename, mylist_rule, stats):
+        """
+        Add the cost of reading a logfile once
+        :param logfilename: The monitored logfile
+        :param mylist_rule: The search patterns (PatternRule) of the logfile
+        :param stats: The cost of reading the logfile (ScanStats)
+        :return:
+        """
+        item = self.files.setdefault(logfilename, [0, 0, 0, 0, 0.0, 0.0])
+        item[0] += 1
+        item[1] += stats.bytes_read
+        item[2] += stats.lines_read
+        item[3] += stats.searched_lines
+        item[4] += stats.read_seconds
+        item[5] += stats.match_seconds
+        self.phase_seconds["read"] += stats.read_seconds
+        self.phase_seconds["match"] += stats.match_seconds
+
+        for rule, (evaluations, seconds) in zip(mylist_rule, stats.rule_costs):
+            item = self.rules.setdefault((rule.logicalname, rule.search_type, rule.search_str), [0, 0, 0, 0.0])
+            item[0] += evaluations
+            item[3] += seconds
+
+    def add_events(self, rule, hits, events):
+        """
+        :param rule: The search pattern (PatternRule)
+        :param hits: The number of hits of the pattern in a logfile
+        :param events: The number of events generated for them
+        :return:
+        """
+        item = self.rules.setdefault((rule.logicalname, rule.search_type, rule.search_str), [0, 0, 0, 0.0])
+        item[1] += hits
+        item[2] += events
+
+    def retain(self, mylist_logfile):
+        """
+        Remove the metrics of the logfiles and search patterns which are not monitored any more
+        :param mylist_logfile: [(logfilename, rule)], see trans_pattern_logfile
+        :return:
+        """
+        logfilenames = set(logfilename for logfilename, rule in mylist_logfile)
+        rule_keys = set((rule.logicalname, rule.search_type, rule.search_str) for logfilename, rule in mylist_logfile)
+        for logfilename in set(self.files) - logfilenames:
+            del self.files[logfilename]
+        for rule_key in set(self.rules) - rule_keys:
+            del self.rules[rule_key]
+
+    def write(self, metrics_file, lagging):
+        """
+        Write the metrics with Prometheus text format, at most once every METRICS_INTERVAL seconds
+        :param metrics_file: The file to write, E.g LogfileMonitorMetrics.prom
+        :param lagging: The bytes which are not read yet {logfilename: lag bytes}
+        :return:
+        """
+        now = time.monotonic()
+        if self.written is not None and now - self.written < METRICS_INTERVAL:
+            return
+        self.written = now
+
+        lines = []
+
+        def add_metric(name, metric_type, description, samples):
+            lines.append("# HELP logfilemonitor_%s %s" % (name, description))
+            lines.append("# TYPE logfilemonitor_%s %s" % (name, metric_type))
+            for labels, value in samples:
+                lines.append("logfilemonitor_%s%s %s" % (name, format_metric_labels(labels) if labels else "",
+                                                         repr(value)))
+
+        add_metric("cycles_total", "counter", "The intervals of RUN mode", [([], self.cycles)])
+        add_metric("cycle_seconds", "gauge", "The time of the last interval", [([], round(self.cycle_seconds, 6))])
+        add_metric("last_cycle_timestamp_seconds", "gauge", "The time when the last interval is done",
+                   [([], int(time.time()))])
+        add_metric("phase_seconds_total", "counter", "The time of every phase of the intervals",
+                   [([("phase", phase)], round(seconds, 6)) for phase, seconds in self.phase_seconds.items()])
+
+        logfilenames = sorted(self.files)
+        file_metrics = [("scans_total", "counter", "The times the logfile is read"),
+                        ("read_bytes_total", "counter", "The bytes read from the logfile"),
+                        ("read_lines_total", "counter", "The lines read from the logfile"),
+                        ("searched_lines_total", "counter",
+                         "The lines which are decoded and searched for the patterns, the others are skipped by "
+                         "the literals of patterns"),
+                        ("read_seconds_total", "counter", "The time of reading the logfile"),
+                        ("match_seconds_total", "counter", "The time of searching the patterns from the logfile")]
+        for k in range(len(file_metrics)):
+            name, metric_type, description = file_metrics[k]
+            add_metric("file_" + name, metric_type, description,
+                       [([("logfile", logfilename)], round(self.files[logfilename][k], 6))
+                        for logfilename in logfilenames])
+        add_metric("file_lag_bytes", "gauge", "The bytes which are not read yet",
+                   [([("logfile", logfilename)], lagging.get(logfilename, 0)) for logfilename in logfilenames])
+
+        rule_keys = sorted(self.rules)
+        rule_metrics = [("evaluations_total", "counter", "The times the regexp of the pattern is searched"),
+                        ("hits_total", "counter", "The matched lines of the pattern in the intervals"),
+                        ("events_total", "counter", "The events generated for the pattern"),
+                        ("seconds_total", "counter", "The estimated time of searching the regexp of the pattern")]
+        for k in range(len(rule_metrics)):
+            name, metric_type, description = rule_metrics[k]
+            add_metric("rule_" + name, metric_type, description,
+                       [(list(zip(["logicalname", "patternsearchtype", "patternsearch"], rule_key)),
+                         round(self.rules[rule_key][k], 6)) for rule_key in rule_keys])
+
+        with open(metrics_file + "-bak", 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(metrics_file + "-bak", metrics_file)
+
+
+class PollScheduler(object):
+    """
+    Schedule to read the logfiles in RUN mode, a logfile is read only if its stat (inode, size, mtime) is changed
+    The interval of a logfile is doubled (till pollmax) while it is not changed, and reset to pollmin once it is changed
+    With "-w inotify", the logfiles in the watched directories are checked every pollmax, for the missed events
+    """
+    __slots__ = ("files",)
+
+    def __init__(self):
+        # logfilename: [stat, interval, next time]
+        self.files = {}
+
+    def is_due(self, logfilename, mylist_rule, now, watched=False):
+        """
+        Check if the logfile is changed and should be read now
+        :param logfilename: The monitored logfile
+        :param mylist_rule: The search patterns (PatternRule) of the logfile
+        :param now: The current time, from time.monotonic()
+        :param watched: If the directory of logfile is watched with "-w inotify", it is checked every pollmax
+        :return: True or False
+        """
+        poll_min = min(rule.poll_min for rule in mylist_rule)
+        poll_max = max(min(rule.poll_max for rule in mylist_rule), poll_min)
+        if watched:
+            poll_min = poll_max
+
+        state = self.files.get(logfilename)
+        if state and now < state[2]:
+            return False
+
+        key = self.get_stat(logfilename)
+        if state is None or key is None or key != state[0]:
+            self.files[logfilename] = [key, poll_min, now + poll_min]
+            return True
+
+        state[1] = min(state[1] * 2, poll_max)
+        state[2] = now + state[1]
+        return False
+
+    def reset(self, logfilename, mylist_rule, now):
+        """
+        Save the stat of the logfile which is read by the events of "-w inotify", it is checked again after pollmax
+        :param logfilename: The monitored logfile
+        :param mylist_rule: The search patterns (PatternRule) of the logfile
+        :param now: The current time, from time.monotonic()
+        :return:
+        """
+        poll_max = max(min(rule.poll_max for rule in mylist_rule), min(rule.poll_min for rule in mylist_rule))
+        self.files[logfilename] = [self.get_stat(logfilename), poll_max, now + poll_max]
+
+    def get_stat(self, logfilename):
+        """
+        :param logfilename: The monitored logfile
+        :return: (device, inode, size, mtime), or None if it is not existing
+        """
+        try:
+            stat = os.stat(logfilename)
+            return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime
+        except OSError:
+            return None
+
+    def retain(self, logfilenames):
+        """
+        Forget the logfiles which are not monitored any more
+        :param logfilenames: The monitored logfiles
+        :return:
+        """
+        for logfilename in set(self.files) - set(logfilenames):
+            del self.files[logfilename]
+
+
+class HitCounter(object):
+    """
+    Aggregate the matched contents of a pattern while the lines are searched, with bounded memory
+    For "deduplicate: y" the hits are counted by the matched contents, otherwise every hit is kept,
+    at most maxdistinct ones are kept and the others are counted as overflow
+    """
+    __slots__ = ("max_distinct", "counts", "overflow", "overflow_contents", "add")
+
+    def __init__(self, rule):
+        """
+        :param rule: The search pattern (PatternRule)
+        """
+        self.max_distinct = rule.max_distinct
+        self.overflow = 0
+        # The last matched contents over maxdistinct
+        self.overflow_contents = ""
+        if rule.deduplicate:
+            self.counts = collections.OrderedDict()
+            self.add = self.add_deduplicate
+        else:
+            self.counts = []
+            self.add = self.add_every
+
+    def add_deduplicate(self, matched_contents):
+        counts = self.counts
+        if matched_contents in counts:
+            counts[matched_contents] += 1  # if line exists
+        elif len(counts) < self.max_distinct:
+            counts[matched_contents] = 1  # if line is new
+        else:
+            self.overflow += 1
+            self.overflow_contents = matched_contents
+
+    def add_every(self, matched_contents):
+        if len(self.counts) < self.max_distinct:
+            self.counts.append(matched_contents)
+        else:
+            self.overflow += 1
+            self.overflow_contents = matched_contents
+
+    def copy(self):
+        """
+        :return: A copy of the matched contents, to be added separately
+        """
+        counter = HitCounter.__new__(HitCounter)
+        counter.max_distinct = self.max_distinct
+        counter.overflow = self.overflow
+        counter.overflow_contents = self.overflow_contents
+        if isinstance(self.counts, list):
+            counter.counts = list(self.counts)
+            counter.add = counter.add_every
+        else:
+            counter.counts = collections.OrderedDict(self.counts)
+            counter.add = counter.add_deduplicate
+        return counter
+
+    def hits(self):
+        """
+        :return: The number of hits, including the overflow
+        """
+        if isinstance(self.counts, list):
+            return len(self.counts) + self.overflow
+        return sum(self.counts.values()) + self.overflow
+
+    def items(self):
+        """
+        :return: [(matched contents, number of hits)]
+        """
+        if isinstance(self.counts, list):
+            return [(matched_contents, 1) for matched_contents in self.counts]
+        return list(self.counts.items())
+
+    def last(self):
+        """
+        :return: The last matched contents for "deduplicate: n", or the last one over maxdistinct
+        """
+        if self.overflow:
+            return self.overflow_contents
+        if isinstance(self.counts, list) and self.counts:
+            return self.counts[-1]
+        return ""
+
+
+class WindowCounter(object):
+    """
+    The hits of a matched contents in the sliding window, they are counted in a ring of OCCURRENCE_WINDOW_BUCKETS
+    buckets, the oldest buckets are cleared while the time is moving forward
+    """
+    __slots__ = ("bucket_seconds", "bucket", "counts", "total")
+
+    def __init__(self, window, now):
+        """
+        :param window: The window, unit is second
+        :param now: The current time, from time.time()
+        """
+        self.bucket_seconds = float(window) / OCCURRENCE_WINDOW_BUCKETS
+        self.bucket = int(now // self.bucket_seconds)
+        self.counts = [0] * OCCURRENCE_WINDOW_BUCKETS
+        self.total = 0
+
+    def advance(self, now):
+        """
+        Clear the buckets which are out of the window
+        :param now: The current time, from time.time()
+        :return: The number of hits in the window
+        """
+        bucket = int(now // self.bucket_seconds)
+        steps = bucket - self.bucket
+        if steps <= 0:
+            return self.total
+
+        counts = self.counts
+        if steps >= len(counts):
+            counts[:] = [0] * len(counts)
+            self.total = 0
+        else:
+            for i in range(self.bucket + 1, bucket + 1):
+                self.total -= counts[i % len(counts)]
+                counts[i % len(counts)] = 0
+        self.bucket = bucket
+
+        return self.total
+
+    def add(self, num, now):
+        """
+        :param num: The number of new hits
+        :param now: The current time, from time.time()
+        :return: The number of hits in the window
+        """
+        self.advance(now)
+        self.counts[self.bucket % len(self.counts)] += num
+        self.total += num
+
+        return self.total
+
+
+def format_window_line(key, counter):
+    """
+    Format the counter of OccurrenceWindows to save it into the file
+    :param key: (logicalname, logfilename, patternsearchtype, patternsearch, matched contents)
+    :param counter: WindowCounter, or None if it is removed
+    :return: The line of JSON object
+    """
+    if counter is None:
+        return json.dumps(dict(key=list(key))) + "\n"
+    return json.dumps(dict(key=list(key), bucket_seconds=counter.bucket_seconds, bucket=counter.bucket,
+                           counts=counter.counts), sort_keys=True) + "\n"
+
+
+class OccurrenceWindows(object):
+    """
+    The counters of the patterns with window for every logfile & matched contents, kept across the intervals
+    An event is generated once the hits in the window reach the occurrences, and then the counter is cleared
+    The counters are saved to the file (E.g LogfileMonitor.win) with a JSON object per line, to be loaded after restart,
+    it is an append-only journal as LAST_CHECKED_LINE: the changed and removed counters are appended with one write
+    per interval, the latest line wins while loading, and it is compacted with an atomic rename
+    """
+
+    def __init__(self, filename=None):
+        """
+        :param filename: The file to save the counters, None to keep them in memory only
+        """
+        self.filename = filename
+        # {(logicalname, logfilename, patternsearchtype, patternsearch, matched contents): WindowCounter}
+        self.counters = {}
+        # The counters which are changed since the last save, None if it is removed
+        self.changed = collections.OrderedDict()
+        self.journal_lines = 0
+        if filename:
+            self.load()
+
+    def load(self):
+        """
+        Load the counters saved before restart, the invalid lines are skipped
+        :return:
+        """
+        try:
+            with open(self.filename, 'r') as f:
+                lines = f.readlines()
+        except IOError:
+            return
+
+        broken = False
+        for line in lines:
+            try:
+                if not line.endswith("\n"):
+                    # The last line is not completed while the journal was interrupted
+                    raise ValueError(line)
+                item = json.loads(line)
+                key = tuple(item["key"])
+                self.journal_lines += 1
+                if "counts" not in item:
+                    # The counter is removed
+                    self.counters.pop(key, None)
+                    continue
+                counter = WindowCounter.__new__(WindowCounter)
+                counter.bucket_seconds = float(item["bucket_seconds"])
+                counter.bucket = int(item["bucket"])
+                counter.counts = [int(num) for num in item["counts"]]
+                counter.total = sum(counter.counts)
+                if len(counter.counts) != OCCURRENCE_WINDOW_BUCKETS:
+                    self.counters.pop(key, None)
+                    continue
+                self.counters[key] = counter
+            except (ValueError, KeyError, TypeError):
+                logging.warning("Invalid line in file: %s: %s", self.filename, line.strip())
+                broken = True
+        if broken:
+            self.compact()
+
+    def add(self, rule, logfilename, matched_contents, num, now):
+        """
+        Add the hits of an interval
+        :param rule: The search pattern (PatternRule) with window
+        :param logfilename: exact logfile name with path
+        :param matched_contents: The matched contents, or the pattern for "deduplicate: n" and the hits over
+                                 maxdistinct
+        :param num: The number of new hits
+        :param now: The current time, from time.time()
+        :return: The number of hits in the window, the counter is cleared once it reaches the occurrences
+        """
+        key = (rule.logicalname, logfilename, rule.search_type, rule.search_str, matched_contents)
+        counter = self.counters.get(key)
+        if counter is None or counter.bucket_seconds != float(rule.window) / OCCURRENCE_WINDOW_BUCKETS:
+            # New, or the window is changed
+            counter = self.counters[key] = WindowCounter(rule.window, now)
+
+        total = counter.add(num, now)
+        if total >= rule.occurrences:
+            del self.counters[key]
+            self.changed[key] = None
+        else:
+            self.changed[key] = counter
+
+        return total
+
+    def expire(self, now):
+        """
+        Remove the counters without any hit in the window
+        :param now: The current time, from time.time()
+        :return:
+        """
+        for key in [key for key, counter in self.counters.items() if counter.advance(now) == 0]:
+            del self.counters[key]
+            self.changed[key] = None
+
+    def save(self):
+        """
+        Save the changed counters to the file with one write
+        :return:
+        """
+        if not self.filename or not self.changed:
+            return
+
+        if self.journal_lines + len(self.changed) > max(2 * len(self.counters), CHECKPOINT_COMPACT_LINES):
+            self.compact()
+        else:
+            data = "".join(format_window_line(key, counter) for key, counter in self.changed.items())
+            with open(self.filename, 'a') as f:
+                f.write(data)
+            self.journal_lines += len(self.changed)
+        self.changed.clear()
+
+    def compact(self):
+        """
+        Rewrite the file with the current counters only, it is replaced atomically
+        :return:
+        """
+        data = "".join(format_window_line(key, counter) for key, counter in self.counters.items())
+        with open(self.filename + "-bak", 'w') as f:
+            f.write(data)
+        os.replace(self.filename + "-bak", self.filename)
+        self.journal_lines = len(self.counters)
+
+
+def write_matched_lines(rule, logfilename, matched_lines, windows=None):
+    """
+    Generate the events for the matched lines of a search pattern, and append them to OUT_FILE
+    With window, the hits are counted across the intervals, by the matched contents for "deduplicate: y",
+    otherwise by the pattern
+    :param rule: The search pattern (PatternRule)
+    :param logfilename: exact logfile name with path
+    :param matched_lines: The aggregated matched contents (HitCounter)
+    :param windows: The counters of the patterns with window (OccurrenceWindows)
+    :return: The number of events
+    """
+    events = 0
+    if matched_lines.overflow:
+        logging.warning("%d hits of '%s' are over maxdistinct(%d) in: %s",
+                        matched_lines.overflow, rule.search_str, rule.max_distinct, logfilename)
+
+    if rule.window and windows is not None:
+        # [(the key of counter, number of hits, the matched contents of event)], the hits over maxdistinct
+        # and the ones of "deduplicate: n" are counted by the pattern, and reported with the last matched contents
+        if rule.deduplicate:
+            hits = [(matched_contents, num, matched_contents) for matched_contents, num in matched_lines.items()]
+            if matched_lines.overflow:
+                hits.append((rule.search_str, matched_lines.overflow, matched_lines.last()))
+        else:
+            hits = [(rule.search_str, matched_lines.hits(), matched_lines.last())]
+        now = time.time()
+        for key, num, matched_contents in hits:
+            if num:
+                num = windows.add(rule, logfilename, key, num, now)
+                if num >= rule.occurrences:
+                    write_data_outfile(rule.get_out_item(logfilename, matched_contents, num))
+                    events += 1
+        return events
+
+    # Write data to output file
+    for matched_contents, num in matched_lines.items():
+        # REQ13
+        if num >= rule.occurrences:
+            write_data_outfile(rule.get_out_item(logfilename, matched_contents, num))
+            events += 1
+
+    # The hits over maxdistinct are counted by the pattern, and reported with the last matched contents
+    if matched_lines.overflow and matched_lines.overflow >= rule.occurrences:
+        write_data_outfile(rule.get_out_item(logfilename, matched_lines.last(), matched_lines.overflow))
+        events += 1
+
+    return events
+
+
 def write_data_outfile(out_item):
     """
-    Append the data to OUT_FILE
+    Append the data to OUT_FILE, it is buffered until flush_data_outfile
     :param out_item: new data
-    : Global: OUT_FILE, RETURN_CODE_DESC
-    :return: Update OUT_FILE
+    : Global: OUT_BUFFER, RETURN_CODE_DESC
+    :return: Update OUT_BUFFER
     """
 
     global OUT_FILE, RETURN_CODE_DESC
@@ -316,13 +2136,143 @@ def write_data_outfile(out_item):
 
     # Update the message with line's content
 
-    # Append the new item into OUT_FILE
-    out_data = [out_item]
+    # The new item is appended into OUT_FILE by flush_data_outfile, a copy is buffered as the callers
+    # reuse the same dict, E.g OUT_ITEM_SAMPLE
+    OUT_BUFFER.append(dict(out_item))
+
+    return
+
+
+def flush_data_outfile():
+    """
+    Append all the buffered data to OUT_FILE with one write
+    : Global: OUT_FILE, OUT_FORMAT, OUT_BUFFER, OUT_FILE_FSYNC
+    :return: Update OUT_FILE, and return the number of written items
+    """
+    if not OUT_BUFFER:
+        return 0
 
-    result = yaml.dump(out_data, default_flow_style=False)
+    if OUT_FORMAT == "jsonl":
+        # A JSON object per line
+        result = "".join(json.dumps(item, sort_keys=True) + "\n" for item in OUT_BUFFER)
+    else:
+        result = yaml.dump(OUT_BUFFER, Dumper=YAML_DUMPER, default_flow_style=False)
 
     with open(OUT_FILE, "a") as f:
         f.write(result)
+        if OUT_FILE_FSYNC == "y":
+            f.flush()
+            os.fsync(f.fileno())
+
+    num = len(OUT_BUFFER)
+    del OUT_BUFFER[:]
+
+    return num
+
+
+def print_output_items(output_items):
+    """
+    Generate Standard Output for the items with READ_OUTPUT_FORMAT
+    :param output_items: The items from OUT_FILE
+    :return:
+    """
+    separator = READ_OUTPUT_FORMAT["separator"]
+    fields = READ_OUTPUT_FORMAT["fields"]
+
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for item in output_items:
+        if debug:
+            logging.debug("The item is: ")
+            logging.debug(item)
+        # return the item contents with output_string_format format
+        output_string = separator
+        for key in fields.split():
+            if str(item.get(key)):
+                output_string = "%s%s%s" % (output_string, separator, item[key])
+            else:
+                logging.error(
+                    "The key of %s maybe wrong to defined in file: %s" % (key, OUT_FILE))
+                output_string = "%s%sNULL" % (output_string, separator)
+
+        output_string = output_string.strip(separator)
+        print(output_string)
+
+    return
+
+
+def read_jsonl_lines(file, offset, output_items):
+    """
+    Read the completed lines of the JSON Lines file from the offset
+    :param file: The file name with path
+    :param offset: The byte offset to start with
+    :param output_items: The read items are appended
+    :return: offset, after the last completed line
+    """
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # It is being written by RUN mode, read it next time
+                break
+            offset += len(line)
+            try:
+                output_items.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                logging.error("Invalid line in file: %s: %s" % (file, line.strip()))
+
+    return offset
+
+
+def read_jsonl_outfile():
+    """
+    Read the new data of OUT_FILE with JSON Lines format from the cursor, and Generate Standard Output for them
+    The cursor is saved as the device, inode and byte offset of OUT_FILE to the file: LogfileMonitorOut.cur
+    :global: OUT_FILE
+    :return:
+    """
+    cursor_file = "%s.cur" % os.path.splitext(OUT_FILE)[0]
+    device, inode, offset = 0, 0, 0
+    if os.path.isfile(cursor_file):
+        with open(cursor_file) as f:
+            fields = f.read().split()
+            if len(fields) == 3:
+                device, inode, offset = [int(field) for field in fields]
+
+    output_items = []
+    stat = os.stat(OUT_FILE)
+    if inode and (device, inode) != (stat.st_dev, stat.st_ino):
+        # OUT_FILE was rotated, read the rest of the rotated file at first
+        if os.path.isfile("%s.1" % OUT_FILE):
+            stat2 = os.stat("%s.1" % OUT_FILE)
+            if (device, inode) == (stat2.st_dev, stat2.st_ino):
+                read_jsonl_lines("%s.1" % OUT_FILE, offset, output_items)
+        offset = 0
+    elif stat.st_size < offset:
+        offset = 0
+
+    offset = read_jsonl_lines(OUT_FILE, offset, output_items)
+
+    # Rotate the outfile with OUT_FILE_MAX_SIZE and 1 backup, after all data are read
+    if offset > OUT_FILE_MAX_SIZE and offset == os.path.getsize(OUT_FILE):
+        os.rename(OUT_FILE, "%s.1" % OUT_FILE)
+        with open(OUT_FILE, "a"):
+            pass
+
+    # REQ14: Generate event by READ mode while in TTL
+    items = []
+    for item in output_items:
+        for item_key in READ_OUTPUT_FORMAT["fields"].split():
+            # Fill the field with value as NULL
+            if item_key not in item:
+                item[item_key] = ""
+        if int(item["ttl"] or 0) * 60 > int(time.time()) - int(item["timestamp"] or 0):
+            items.append(item)
+    print_output_items(items)
+
+    # Save the cursor after the output, it is still for the rotated file and checked by the next time
+    with open("%s-bak" % cursor_file, 'w') as f:
+        f.write("%d %d %d\n" % (stat.st_dev, stat.st_ino, offset))
+    os.replace("%s-bak" % cursor_file, cursor_file)
 
     return
 
@@ -357,6 +2307,18 @@ def check_valid_parameters(mydict, keys):
     return str1
 
 
+def check_positive_integer(value):
+    """
+    Check if the value is a positive integer, E.g 10 or "10"
+    :param value:
+    :return: Boolean, True or False
+    """
+    try:
+        return int(value) > 0
+    except (TypeError, ValueError):
+        return False
+
+
 def valid_para_config_file(mydict):
     """
     Check the parameters in config file (e.g LogfileMonitorParam.yml)
@@ -376,7 +2338,7 @@ def valid_para_config_file(mydict):
         str1 = "Missing: %s" % str1
 
     # The Optional parameters
-    para2 = []
+    para2 = ["maxdistinct", "pollmin", "pollmax", "maxbytes", "maxlines", "window"]
 
     str2 = check_valid_parameters(mydict, para + para2)
     if str2:
@@ -428,6 +2390,21 @@ def valid_para_config_file(mydict):
                 script_exit = True
                 RC = 5
 
+    # Check the optional parameters of positive integer, for logicalname or patternmatch
+    for key in ["maxdistinct", "pollmin", "pollmax", "maxbytes", "maxlines", "window"]:
+        for item in [mydict] + list(mydict["patternmatch"]):
+            if key in item.keys() and not check_positive_integer(item[key]):
+                str1 += " && Invalid: %s" % key
+                script_exit = True
+                RC = 5
+
+    # The whole logfile is searched every interval for "readtype: full", the hits are not counted across intervals
+    if str(mydict.get("readtype", "")).lower() == "full" \
+            and any("window" in item.keys() for item in [mydict] + list(mydict["patternmatch"])):
+        str1 += " && Invalid: %s" % "window"
+        script_exit = True
+        RC = 5
+
     if script_exit:
         logging.error("Parameter is missing/invalid from config file: %s" % str1)
 
@@ -473,54 +2450,464 @@ def valid_yaml_format(filename, dump_data, valid_type):
     return
 
 
-def process_already_running(process_name):
+class InotifyWatcher(object):
     """
-    If the process (no case sensitive) is already running or not
-    Check for Linux platform only FOR NOW
-    :param process_name: The process identified by "ps -ef"
-    :return: Boolean, True or False
+    Watch the directories of the logfiles with inotify (Linux only), to read the logfiles while they are changed
+    The events of the files in a watched directory are reported with their names, E.g the logfile is modified,
+    or it is created/moved to while it is rotated
     """
-    p = subprocess.Popen(['ps', '-ef'], stdout=subprocess.PIPE)
-    out, err = p.communicate()
-
-    process_duplicate = False
-    process_running = False
-    for line in out.splitlines():
-        line = str(line, encoding='utf-8').lower()
-        if process_name.lower() in str(line):
-            if not process_running:
-                # For the first discovered running process
-                # Get the pid and ppid for 'ps aux'
-                pid = int(line.split()[1])
-                ppid = int(line.split()[2])
-                process_running = True
+    IN_MODIFY = 0x00000002
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1: %s" % os.strerror(ctypes.get_errno()))
+        self.watches = {}  # directory: watch descriptor
+        self.directories = {}  # watch descriptor: directory
+
+    def watch(self, directories):
+        """
+        Watch the directories, and stop watching the others
+        :param directories: The directories of logfiles
+        :return:
+        """
+        directories = set(directories)
+        for directory in list(self.watches.keys()):
+            if directory not in directories:
+                self.libc.inotify_rm_watch(self.fd, self.watches.pop(directory))
+        for directory in directories:
+            if directory in self.watches:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                             self.IN_MODIFY | self.IN_MOVED_TO | self.IN_CREATE)
+            if wd < 0:
+                logging.warning("Failed to watch the directory: %s: %s"
+                                % (directory, os.strerror(ctypes.get_errno())))
+                continue
+            self.watches[directory] = wd
+            self.directories[wd] = directory
+
+    def wait(self, timeout, logfilenames):
+        """
+        Wait for the changes of the monitored logfiles in watched directories, the events of the other files,
+        E.g OUT_FILE or the other logs in the same directory, are ignored
+        :param timeout: The maximal time to wait, unit is second
+        :param logfilenames: The monitored logfiles
+        :return: The set of changed logfiles, or None if the events are overflowed
+        """
+        monitored = dict((os.path.normpath(logfilename), logfilename) for logfilename in logfilenames)
+        changed_files = set()
+        deadline = time.monotonic() + timeout
+        while not changed_files:
+            readable = select.select([self.fd], [], [], max(deadline - time.monotonic(), 0))[0]
+            if not readable:
+                break
 
+            # Collect more changes in a short time, and read all the events
+            time.sleep(INOTIFY_DELAY)
+            while True:
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except (IOError, OSError):
+                    # EAGAIN, there is not any event
+                    break
+                pos = 0
+                while pos + self.EVENT_HEADER.size <= len(data):
+                    wd, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, pos)
+                    name = data[pos + self.EVENT_HEADER.size:pos + self.EVENT_HEADER.size + length].rstrip(b"\0")
+                    pos += self.EVENT_HEADER.size + length
+                    if mask & self.IN_Q_OVERFLOW:
+                        return None
+                    if mask & self.IN_IGNORED:
+                        # The directory is removed
+                        directory = self.directories.pop(wd, None)
+                        if self.watches.get(directory) == wd:
+                            del self.watches[directory]
+                        continue
+                    if wd in self.directories and name:
+                        path = os.path.normpath(os.path.join(self.directories[wd], os.fsdecode(name)))
+                        if path in monitored:
+                            changed_files.add(monitored[path])
+
+        return changed_files
+
+
+def lock_process(lock_file):
+    """
+    Lock the pid file, to make sure only one process is running for the mode in the working directory
+    The lock is released by the system once the process exits, even if it is killed
+    :param lock_file: The pid file
+    :return: The opened pid file which must be kept opened while running, or None if it is locked by another process
+    """
+    f = open(lock_file, "a+")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        f.close()
+        return None
+
+    f.truncate(0)
+    f.write("%d\n" % os.getpid())
+    f.flush()
+
+    return f
+
+
+class RunCycle(object):
+    """
+    The state of RUN mode which is kept across the intervals, and run() reads the logfiles for one interval
+    It is used by main() for RUN mode, and by bench/LogfileMonitorBench.py to measure the intervals
+    """
+
+    def __init__(self, param_file, checkpoint_store, lag_file, watcher=None, metrics_file=None, window_file=None):
+        """
+        :param param_file: The parameter file
+        :param checkpoint_store: The checkpoints of every logicalname & logfilename (CheckpointStore)
+        :param lag_file: The file to save the bytes which are not read yet, see write_lag_file
+        :param watcher: The InotifyWatcher with "-w inotify", or None to poll the logfiles
+        :param metrics_file: The file to write the metrics, see RunMetrics.write, None not to write them
+        :param window_file: The file to save the counters of the patterns with window, see OccurrenceWindows
+        """
+        # Load the parameter file once, and again once it is changed or on SIGHUP
+        self.param_config = ParamConfig(param_file)
+        self.checkpoint_store = checkpoint_store
+        self.lag_file = lag_file
+        self.watcher = watcher
+        self.metrics_file = metrics_file
+        # The counters and timers since RUN mode is started
+        self.metrics = RunMetrics()
+        # The hits of the patterns with window, kept across the intervals and restarts
+        self.windows = OccurrenceWindows(window_file)
+        # The changed logfiles with "-w inotify", None for all the logfiles
+        self.changed_files = None
+        # Schedule to read the changed logfiles without "-w inotify"
+        self.scheduler = PollScheduler()
+        # The time to search the patterns of "readtype: full" again with "-w inotify", from time.monotonic()
+        self.full_time = None
+        # The cached results of "readtype: full" for every logfile, to search only the appended lines
+        self.result_cache = {}
+        # The logfiles which are not read completely with maxbytes/maxlines/CYCLE_TIME_BUDGET: {logfilename: lag bytes}
+        self.lagging = {}
+        # The logfiles which are left to the next interval by CYCLE_TIME_BUDGET: {logfilename: order}
+        self.deferred = {}
+        # The exact logfilenames with their search patterns in the last interval
+        self.mylist_logfile = []
+
+    def run(self):
+        """
+        Read the logfiles for one interval, write the data to OUT_FILE and save the checkpoints
+        :return: The number of items written to OUT_FILE
+        """
+        cycle_start = timer = time.perf_counter()
+        out_data_item = RUN_OUTPUT_FORMAT
+        # Clear the data, and only keep the keys and default values, and save it as output sample data
+        for k in out_data_item.keys():
+            if k not in ["actualnumberofhits", "maxnumberofhits", "ttl"]:
+                OUT_ITEM_SAMPLE[k] = ""
             else:
-                pid2 = int(line.split()[1])
-                ppid2 = int(line.split()[2])
-                if pid2 == ppid or ppid2 == pid:
-                    # Skip for the process is the parent or child of first discovered process
+                # Set 0 for Interger type data
+                OUT_ITEM_SAMPLE[k] = 0
+
+        # Get the compiled search patterns, the parameter file is loaded again only if it is changed
+        mylist_rule = self.param_config.get_rules()
+
+        # Translate the regexp in logfilename to the exact logfilename/s
+        self.mylist_logfile = mylist_logfile = trans_pattern_logfile(mylist_rule)
+        self.metrics.retain(mylist_logfile)
+        self.metrics.add_phase("expand", time.perf_counter() - timer)
+
+        # Watch the directories before the logfiles are read, so the changes while reading are not missed
+        if self.watcher:
+            self.watcher.watch([os.path.dirname(logfilename) if os.path.dirname(logfilename) else "./"
+                                for logfilename, rule in mylist_logfile])
+
+        if len(mylist_logfile) == 0:
+            logging.warning("There is not any exactly match logfilename.")
+        else:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug("All the search patterns with exact logfilename:")
+                for i in range(len(mylist_logfile)):
+                    logging.debug(mylist_logfile[i])
+
+            """
+            ###
+            # Search pattern in the specific logfile
+            #
+            # Every logfile is read only once for all of its search patterns, which are from:
+            #     logfilename, patternsearch, patternsearchtype
+            # also depends on:
+            #     readtype: Full/Increment
+            #
+            # The match pattern will add into OUT_FILE
+            """
+            self.scheduler.retain([logfilename for logfilename, rule in mylist_logfile])
+            for logfilename in set(self.result_cache) - set(logfilename for logfilename, rule in mylist_logfile):
+                del self.result_cache[logfilename]
+            # The scans in the worker processes which are not merged yet, at most one per worker
+            scanned_list = collections.deque()
+            num_scanned = 0
+            # The logfiles which are not read in the last interval are read at first in the order they were left,
+            # and then the ones which are not read completely
+            mylist_group = group_pattern_logfile(mylist_logfile)
+            mylist_group.sort(key=lambda item: (self.deferred.get(item[0], len(self.deferred)),
+                                                item[0] not in self.lagging))
+            lagging = {}
+            deferred = {}
+            deadline = time.monotonic() + CYCLE_TIME_BUDGET if CYCLE_TIME_BUDGET else None
+            # With "-w inotify", the patterns of "readtype: full" are searched every SCRIPT_INTERVAL_RUN as polling,
+            # not on every change of the logfiles
+            now = time.monotonic()
+            full_due = self.full_time is None or now >= self.full_time
+            if full_due:
+                self.full_time = now + SCRIPT_INTERVAL_RUN
+            for logfilename, mylist_rule in mylist_group:
+                # Wait for a worker with "-j <workers>", so the time budget is checked as in one process
+                if len(scanned_list) >= WORKER_NUMBER:
+                    self.merge(*scanned_list.popleft(), lagging=lagging)
+
+                # Leave the logfiles to the next interval if it is over the time budget
+                if deadline and num_scanned and time.monotonic() > deadline:
+                    lagging[logfilename] = self.lagging.get(logfilename, 0)
+                    deferred[logfilename] = len(deferred)
                     continue
+
+                if self.watcher and not full_due:
+                    mylist_rule = [rule for rule in mylist_rule if rule.read_type == "incremental"]
+                    if not mylist_rule:
+                        continue
+
+                # Skip the logfile if it is not changed and all its patterns are incremental,
+                # with "-w inotify" by its events, otherwise by its stat
+                if logfilename not in self.lagging and all(rule.read_type == "incremental" for rule in mylist_rule):
+                    now = time.monotonic()
+                    directory = os.path.dirname(logfilename) if os.path.dirname(logfilename) else "./"
+                    watched = self.watcher is not None and directory in self.watcher.watches
+                    if self.changed_files is None:
+                        # All the logfiles are read with "-w inotify" in the first interval or the overflowed events
+                        if not self.watcher and not self.scheduler.is_due(logfilename, mylist_rule, now):
+                            continue
+                    elif self.watcher and not watched:
+                        # The directory is not watched, E.g inotify_add_watch failed with ENOSPC/EACCES
+                        if not self.scheduler.is_due(logfilename, mylist_rule, now):
+                            continue
+                    elif logfilename not in self.changed_files:
+                        # The stat is checked every pollmax for the missed events, E.g the logfile on NFS
+                        if not self.scheduler.is_due(logfilename, mylist_rule, now, watched):
+                            continue
+                    if watched:
+                        self.scheduler.reset(logfilename, mylist_rule, now)
+
+                # Process for every monitored logfile, in the worker processes with "-j <workers>"
+                logfile_checkpoints = self.checkpoint_store.get_logfile(
+                    logfilename, set(rule.logicalname for rule in mylist_rule))
+                logfile_results = self.result_cache.get(logfilename, {})
+                if WORKER_POOL:
+                    scanned_list.append((logfilename, mylist_rule, WORKER_POOL.submit(
+                        scan_logfile, logfilename, mylist_rule, logfile_checkpoints, logfile_results)))
                 else:
-                    process_duplicate = True
-                    break
-                    # It is NOT the first discovered running process
-    return process_duplicate
+                    self.merge(logfilename, mylist_rule,
+                               scan_logfile(logfilename, mylist_rule, logfile_checkpoints, logfile_results), lagging)
+                num_scanned += 1
+
+            while scanned_list:
+                self.merge(*scanned_list.popleft(), lagging=lagging)
+
+            self.windows.expire(time.time())
+            if lagging:
+                logging.warning("%d logfiles are not read completely in this interval, %d bytes are left",
+                                len(lagging), sum(lagging.values()))
+            self.lagging = lagging
+            self.deferred = deferred
+
+        # Write the data of this interval to OUT_FILE, and then
+        # save the checkpoint for every logicalname & logfilename to file: LAST_CHECKED_LINE
+        timer = time.perf_counter()
+        num = flush_data_outfile()
+        self.metrics.add_phase("write", time.perf_counter() - timer)
+        timer = time.perf_counter()
+        self.checkpoint_store.commit()
+        write_lag_file(self.lag_file, self.lagging)
+        self.windows.save()
+        self.metrics.add_phase("checkpoint", time.perf_counter() - timer)
+
+        self.metrics.cycles += 1
+        self.metrics.cycle_seconds = time.perf_counter() - cycle_start
+        if self.metrics_file:
+            self.metrics.write(self.metrics_file, self.lagging)
+
+        return num
+
+    def merge(self, logfilename, mylist_rule, scanned, lagging):
+        """
+        Merge the result of a logfile in the order of logfiles, the output and checkpoints are written only here
+        :param logfilename: The monitored logfile
+        :param mylist_rule: The search patterns (PatternRule) of the logfile
+        :param scanned: The result of scan_logfile, or its future with "-j <workers>"
+        :param lagging: The logfiles which are not read completely in this interval, it is updated
+        :return:
+        """
+        matched_list, last_line_list, result_list, stats = scanned.result() if WORKER_POOL else scanned
+        timer = time.perf_counter()
+        if any(rule.read_type == "full" for rule in mylist_rule):
+            self.result_cache[logfilename] = dict((item["logicalname"], item) for item in result_list)
+        self.metrics.add_scan(logfilename, mylist_rule, stats)
+
+        for rule, matched_lines in zip(mylist_rule, matched_list):
+            events = write_matched_lines(rule, logfilename, matched_lines, self.windows)
+            self.metrics.add_events(rule, matched_lines.hits(), events)
+
+        # Updated only when for "incremental"
+        for item in last_line_list:
+            self.checkpoint_store.update(item)
+
+        # The bytes which are not read yet
+        if stats.lag_bytes > 0:
+            lagging[logfilename] = stats.lag_bytes
+        self.metrics.add_phase("aggregate", time.perf_counter() - timer)
+
+    def wait(self, timeout):
+        """
+        Wait for the changes of logfiles with "-w inotify", or sleep to next interval
+        :param timeout: The interval, unit is second
+        :return:
+        """
+        if self.watcher:
+            if self.full_time is not None:
+                timeout = min(timeout, max(self.full_time - time.monotonic(), 0))
+            self.changed_files = self.watcher.wait(timeout, [logfilename for logfilename, rule in self.mylist_logfile])
+        else:
+            time.sleep(timeout)
+
+
+class CycleProfiler(object):
+    """
+    Profile the first intervals of RUN mode with "--profile <directory>", and save into the directory:
+        cycle-<N>.pstats: The cProfile of every interval, E.g to view with: python3 -m pstats cycle-0001.pstats
+        stacks.collapsed: The stacks sampled every PROFILE_SAMPLE_INTERVAL of CPU time with signal.setitimer, the
+                          input of flamegraph.pl, it is not saved on the platforms without setitimer (E.g Windows)
+        summary.txt: The top functions of LogfileMonitor.py in all the profiled intervals
+    The stacks are sampled while cProfile is enabled, so the functions with many calls are a bit overweighted,
+    and the logfiles scanned in the worker processes with "-j <workers>" are not profiled
+    """
+
+    def __init__(self, profile_dir, cycles):
+        """
+        :param profile_dir: The directory to save the profiles, it is created if it does not exist
+        :param cycles: The number of intervals to profile
+        """
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        self.profile_dir = profile_dir
+        self.cycles = cycles
+        self.cycle = 0
+        self.pstats_files = []
+        # {collapsed stack: number of samples}
+        self.stacks = collections.Counter()
+
+    def sample(self, signum, frame):
+        """
+        The handler of SIGPROF, count the stack of the interrupted frame
+        """
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self, run_cycle):
+        """
+        Run an interval, it is profiled if it is one of the first intervals
+        :param run_cycle: The state of RUN mode (RunCycle)
+        :return: The number of items written to OUT_FILE, see RunCycle.run
+        """
+        if self.cycle >= self.cycles:
+            return run_cycle.run()
+        self.cycle += 1
+
+        sampling = hasattr(signal, "setitimer")
+        if sampling:
+            handler = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, PROFILE_SAMPLE_INTERVAL, PROFILE_SAMPLE_INTERVAL)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            num = run_cycle.run()
+        finally:
+            profiler.disable()
+            if sampling:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, handler)
+
+        pstats_file = os.path.join(self.profile_dir, "cycle-%04d.pstats" % self.cycle)
+        profiler.dump_stats(pstats_file)
+        self.pstats_files.append(pstats_file)
+
+        # The stacks of all the profiled intervals, with the format: frame;frame;frame samples
+        if sampling:
+            with open(os.path.join(self.profile_dir, "stacks.collapsed"), "w") as f:
+                for stack in sorted(self.stacks):
+                    f.write("%s %d\n" % (stack, self.stacks[stack]))
+
+        if self.cycle == self.cycles:
+            self.write_summary()
+            logging.info("%d intervals are profiled, see the summary in: %s"
+                         % (self.cycles, os.path.join(self.profile_dir, "summary.txt")))
+
+        return num
+
+    def write_summary(self):
+        """
+        Save the top functions of LogfileMonitor.py by the cumulative and own time of all the profiled intervals,
+        and the top functions by the own samples of the sampled stacks
+        :return:
+        """
+        with open(os.path.join(self.profile_dir, "summary.txt"), "w") as f:
+            stats = pstats.Stats(*self.pstats_files, stream=f)
+            for sort_key, description in [("cumulative", "the cumulative time"), ("tottime", "the own time")]:
+                f.write("The top functions of %s in %d intervals by %s:\n" % (SCRIPT_NAME, self.cycle, description))
+                stats.sort_stats(sort_key).print_stats(re.escape(SCRIPT_NAME), PROFILE_TOP_FUNCTIONS)
+
+            total = sum(self.stacks.values())
+            if total:
+                own_samples = collections.Counter()
+                for stack, num in self.stacks.items():
+                    own_samples[stack.rsplit(";", 1)[-1]] += num
+                f.write("The top functions by the own samples of %d sampled stacks:\n\n" % total)
+                for function, num in own_samples.most_common(PROFILE_TOP_FUNCTIONS):
+                    f.write("%8d %6.2f%%  %s\n" % (num, num * 100.0 / total, function))
 
 
 def main():
-    global PARAM_FILE, OUT_FILE
+    global PARAM_FILE, OUT_FILE, OUT_FORMAT, WORKER_POOL, WORKER_NUMBER, LOG_LISTENER
     global OUT_ITEM_SAMPLE, SCRIPT_INTERVAL_RUN
 
     # global FORMAT_FILE
     global READ_OUTPUT_FORMAT, RUN_OUTPUT_FORMAT
 
     try:
+        # Write the logs by a background thread
+        setup_logging()
+
         # Get args
         argv = sys.argv
-        logging.debug(argv)
         mydict = get_argv_dict(argv)
 
+        # Set the log level
+        log_level = mydict.get("-l", LOG_LEVEL).lower()
+        if log_level not in ["debug", "info", "warning", "error"]:
+            logging.error("The value of '-l' is not valid: %s" % log_level)
+            RC = 3
+            raise SystemExit(RC)
+        logging.getLogger().setLevel(log_level.upper())
+        logging.debug(argv)
+
         # Return the version
         if "-v" in mydict.keys():
             print(VERSION)
@@ -541,7 +2928,7 @@ def main():
             raise SystemExit(RC)
 
         # check if there is any unsupported parameter
-        para = ["script", "-m", "-p", "-v", "-h", "-o"]
+        para = ["script", "-m", "-p", "-v", "-h", "-o", "-f", "-w", "-j", "-l", "--profile", "--profile-cycles"]
         for i in mydict.keys():
             found_yn = False
             for item in para:
@@ -563,8 +2950,15 @@ def main():
             RC = 1
             raise SystemExit(RC)
 
+        # Set the format of output file, either yaml or jsonl
+        OUT_FORMAT = mydict.get("-f", "yaml").lower()
+        if OUT_FORMAT not in ["yaml", "jsonl"]:
+            logging.error("The value of '-f' is not valid: %s" % OUT_FORMAT)
+            RC = 3
+            raise SystemExit(RC)
+
         # Set the output file of RUN mode
-        OUT_FILE = os.path.join(WORKING_DIR, "LogfileMonitorOut.yml")
+        OUT_FILE = os.path.join(WORKING_DIR, "LogfileMonitorOut.%s" % ("jsonl" if OUT_FORMAT == "jsonl" else "yml"))
 
         # validate the value of "-m", it should be either RUN or READ
         script_mode = mydict.get("-m").lower()
@@ -573,6 +2967,20 @@ def main():
             RC = 3
             raise SystemExit(RC)
 
+        # exit if another deamon/process is already running for the mode, with the lock of pid file
+        if fcntl is None:
+            logging.error("It is not supported to check the running process on other platforms")
+            RC = 100
+            raise SystemExit(RC)
+
+        PID_FILE = os.path.join(WORKING_DIR, "%s.%s.pid" % (os.path.splitext(SCRIPT_NAME)[0], script_mode))
+        PID_LOCK = lock_process(PID_FILE)
+        if PID_LOCK is None:
+            logging.error("The process(%s -m %s) is already running, Please verify with the pid in: %s"
+                          % (SCRIPT_NAME, script_mode, PID_FILE))
+            RC = 7
+            raise SystemExit(RC)
+
         # create the file to save the number of last checked line for every logfile
         LAST_CHECKED_LINE = os.path.join(WORKING_DIR, "%s" % SCRIPT_NAME.replace(".py", ".loc"))
 
@@ -581,362 +2989,74 @@ def main():
             with open(LAST_CHECKED_LINE, 'w') as f:
                 # f.write("logicalname     logfilename      0\n")
                 # Modified for REQ3, add filesize as the last column
-                f.write("logicalname     logfilename      0      0\n")
+                # f.write("logicalname     logfilename      0      0\n")
+                # Add byte offset as the last column
+                f.write("logicalname     logfilename      0      0      0\n")
 
         OUT_ITEM_SAMPLE = {}
 
-        RC = 0
-        while True:
-            if script_mode == "run":
-                # exit if another deamon/process is already running for 'run'
-                names = ["LogfileMonitor -m run", "LogfileMonitor.py -m run"]
-                for name in names:
-                    if sys.platform == "linux":
-                        if process_already_running(name):
-                            logging.error(
-                                "The process(%s) is already running, Please verify with 'ps -f' command!!!" % name)
-                            RC = 7
-                            raise SystemExit(RC)
-                    else:
-                        logging.error("It is not supported to check the running process on other platforms")
-                        RC = 100
-                        raise SystemExit(RC)
-
-                out_data_item = RUN_OUTPUT_FORMAT
-                # Clear the data, and only keep the keys and default values, and save it as output sample data
-                for k in out_data_item.keys():
-                    if k not in ["actualnumberofhits", "maxnumberofhits", "ttl"]:
-                        OUT_ITEM_SAMPLE[k] = ""
-                    else:
-                        # Set 0 for Interger type data
-                        OUT_ITEM_SAMPLE[k] = 0
-
-                # Get parameters from file
-                mylist_param = get_from_yaml(PARAM_FILE)
-                logging.debug("data for parameter file:\n %s" % mylist_param)
-                # Check if the YAML file is valid (list data type)
-                valid_yaml_format(PARAM_FILE, mylist_param, "list")
-
-                # Check if the parameters are valid
-                for i in range(len(mylist_param)):
-                    valid_para_config_file(mylist_param[i])
+        # Load the checkpoints once for RUN mode
+        if script_mode == "run":
+            CHECKPOINT_STORE = CheckpointStore(LAST_CHECKED_LINE)
 
-                # Translate the parameters to every patternsearch
-                mylist_pattern = []
-                mylist_pattern = trans_param_pattern(mylist_param, mylist_pattern)
-                # Add default value into if it is missing in parameter file
-                for k in range(len(mylist_pattern)):
-                    if mylist_pattern[k].get("ttl") == None:
-                        mylist_pattern[k]["ttl"] = 99
+        # Set the mode to wait for the changes of logfiles, either poll or inotify
+        watch_mode = mydict.get("-w", "poll").lower()
+        if watch_mode not in ["poll", "inotify"]:
+            logging.error("The value of '-w' is not valid: %s" % watch_mode)
+            RC = 3
+            raise SystemExit(RC)
 
-                logging.debug("data for patterns:\n%s" % mylist_pattern)
+        WATCHER = None
+        if script_mode == "run" and watch_mode == "inotify":
+            try:
+                WATCHER = InotifyWatcher()
+            except (OSError, AttributeError) as e:
+                logging.warning("inotify is not available, poll the logfiles every interval instead: %s" % e)
+
+        # Scan the logfiles in the worker processes for RUN mode, if the number of workers is more than 1
+        workers = mydict.get("-j", "1")
+        if not check_positive_integer(workers):
+            logging.error("The value of '-j' is not valid: %s" % workers)
+            RC = 3
+            raise SystemExit(RC)
 
-                # debugging: list out all the search patterns
-                logging.debug("All the search patterns with exact logfilename expresion:")
-                for i in range(len(mylist_pattern)):
-                    logging.debug(mylist_pattern[i])
+        if script_mode == "run" and int(workers) > 1:
+            WORKER_NUMBER = int(workers)
+            WORKER_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=WORKER_NUMBER)
+
+        # The state of RUN mode across the intervals, the parameter file is loaded again on SIGHUP
+        if script_mode == "run":
+            LAG_FILE = os.path.join(WORKING_DIR, "%s.lag" % os.path.splitext(SCRIPT_NAME)[0])
+            # The counters and timers per logfile, pattern and phase, with Prometheus text format
+            METRICS_FILE = os.path.join(WORKING_DIR, "%sMetrics.prom" % os.path.splitext(SCRIPT_NAME)[0])
+            # The hits of the patterns with window, to count them across the restarts
+            WINDOW_FILE = os.path.join(WORKING_DIR, "%s.win" % os.path.splitext(SCRIPT_NAME)[0])
+            RUN_CYCLE = RunCycle(PARAM_FILE, CHECKPOINT_STORE, LAG_FILE, WATCHER, METRICS_FILE, WINDOW_FILE)
+            if hasattr(signal, "SIGHUP"):
+                signal.signal(signal.SIGHUP, RUN_CYCLE.param_config.request_reload)
+
+        # Profile the first intervals of RUN mode
+        profile_cycles = mydict.get("--profile-cycles", str(PROFILE_CYCLES))
+        if not check_positive_integer(profile_cycles):
+            logging.error("The value of '--profile-cycles' is not valid: %s" % profile_cycles)
+            RC = 3
+            raise SystemExit(RC)
 
-                # Translate the regexp in logfilename to the exact logfilename/s
-                mylist_logfile = trans_pattern_logfile(mylist_pattern)
+        PROFILER = None
+        if script_mode == "run" and mydict.get("--profile"):
+            PROFILER = CycleProfiler(mydict["--profile"], int(profile_cycles))
 
-                if len(mylist_logfile) == 0:
-                    logging.warning("There is not any exactly match logfilename.")
+        RC = 0
+        while True:
+            if script_mode == "run":
+                if PROFILER:
+                    PROFILER.run(RUN_CYCLE)
                 else:
-                    logging.debug("All the search patterns with exact logfilename:")
-                    for i in range(len(mylist_logfile)):
-                        logging.debug(mylist_logfile[i])
-
-                    """
-                    ###
-                    # Search pattern in the specific logfile
-                    #
-                    # Useful keys for searching are:
-                    #     logfilename, patternsearch, patternsearchtype ???
-                    # also depends on:
-                    #     readtype: Full/Increment
-                    #
-                    # The match pattern will add into global variable:out_data (a list which contains dictionary type data)
-                    """
-                    last_line_list = []
-
-                    for i in range(len(mylist_logfile)):
-                        # Process for every monitored logfile
-                        mylist_logfile_entry = mylist_logfile[i]
-
-                        logfilename = mylist_logfile_entry["logfilename"]  # exact logfile name with path
-                        search_type = mylist_logfile_entry.get("patternsearchtype", "substring").lower()
-                        search_str = mylist_logfile_entry["patternsearch"]  # regural expression
-                        read_type = mylist_logfile_entry["readtype"].lower()  # incremental/full
-
-                        logging.debug(
-                            "Start to search: \npatternsearch: %s  readtype: %s \nlogfilename: %s \npatternsearchtype: %s"
-                            % (search_str, read_type, logfilename, search_type))
-                        matched_lines = []  # Record the matched lines' contents, an item per matched line' content
-                        # The data should like:
-                        # [{line: $line}, {line: $line}]
-
-                        # Get the number of last checked lines from file: LAST_CHECKED_LINE
-                        last_number = 0
-                        logicalname = mylist_logfile_entry["logicalname"]
-                        logfilename = mylist_logfile_entry["logfilename"]
-                        file_size = 0
-                        with open(LAST_CHECKED_LINE, 'r') as f:
-                            for line in f:
-                                if len(line.split()) >= 4:
-                                    if line.split()[0] == logicalname and line.split()[1] == logfilename:
-                                        # The first field is the logfile name
-                                        last_number = int(line.split()[2])
-                                        file_size = int(line.split()[3])
-                                        break
-                                else:
-                                    logging.warning(
-                                        "There not so many fields defined in file(>=4): %s" % LAST_CHECKED_LINE)
-
-                        # search the pattern in logfilename
-                        logging.debug("Search the pattern in logfilename")
-
-                        with open(logfilename, 'r') as f:
-                            # skip to the last checked line for "readtype: incremental"
-                            logging.debug("Skip to the last checked line")
-                            if read_type == "incremental":
-                                if os.path.getsize(logfilename) >= file_size:
-                                    # For REQ3, while logfilename is NOT trimmed, skip to the already read lines
-                                    for ii in range(0, last_number):
-                                        dummy = f.readline()
-                                else:
-                                    last_number = 0
-                                file_size = os.path.getsize(logfilename)
-
-                            # search the pattern
-                            while True:
-                                logging.debug("Search the pattern")
-                                line = f.readline()
-                                if line:
-                                    last_number += 1
-                                    logging.debug("Search the pattern from whole line")
-                                    if search_type == "regexp":
-                                        matched_str = re.search(search_str, line)
-                                        if matched_str:
-                                            # Consider the same "patternsearch" as duplicate
-                                            matched_lines.append(dict(matched_contents=matched_str.group(0)))
-                                    elif search_type == "starts with":
-                                        if line.startswith(search_str):
-                                            matched_lines.append(dict(matched_contents=search_str))
-                                    elif search_type == "ends with":
-                                        if line.endswith(search_str):
-                                            matched_lines.append(dict(matched_contents=search_str))
-                                    elif search_type == "substring":
-                                        if line.find(search_str) >= 0:
-                                            matched_lines.append(dict(matched_contents=search_str))
-                                    elif search_type == "full":
-                                        if line == search_str:
-                                            matched_lines.append(dict(matched_contents=search_str))
-                                else:
-                                    break
-
-                            # Save the last_number for every logicalname & logfilename to list variable: last_line_list
-                            # Only when read_type is "incremental"
-                            if read_type == "incremental":
-                                logging.debug(
-                                    "Save the last_number and filesize for every logicalname & logfilename to list: \n")
-                                existing_YN = False
-                                # Check if the last_number is already exising for logicalname & logfilename
-                                for item in last_line_list:
-                                    if item["logicalname"] == logicalname and item["logfilename"] == logfilename:
-                                        # noinspection PyPep8Naming
-                                        existing_YN = True
-                                        item["last_number"] = last_number
-                                        # for REQ3
-                                        item["file_size"] = file_size
-
-                                if not existing_YN:
-                                    # Append it as new one
-                                    last_line_list.append(
-                                        dict(logicalname=logicalname, logfilename=logfilename, last_number=last_number,
-                                             file_size=file_size))
-                                    existing_YN = True
-
-                                logging.debug(last_line_list)
-
-                        # print("Matched lines for %s are:" % mylist_logfile_entry["logfilename"])
-
-                        # Process for "deduplicate"
-                        matched_lines_new = []
-                        if mylist_logfile_entry["deduplicate"].lower() == "y":
-                            logging.debug("deduplicate is: %s" % mylist_logfile_entry["deduplicate"])
-                            for j in range(len(matched_lines)):
-
-                                line_content = matched_lines[j]["matched_contents"]  # line's content
-                                found = False
-                                for k in range(len(matched_lines_new)):
-                                    if matched_lines_new[k]["matched_contents"] == line_content:  # Exact match
-                                        found = True
-                                        if "num" in matched_lines_new[k].keys():
-                                            matched_lines_new[k]["num"] += 1  # if line exists
-                                        else:
-                                            matched_lines_new[k]["num"] = 1  # if line is new
-                                if not found:  # If not found, will copy to
-                                    matched_lines_new.append(dict(matched_contents=line_content, num=1))
+                    RUN_CYCLE.run()
 
-                        else:
-                            matched_lines_new = copy.deepcopy(matched_lines)
-                            for j in range(len(matched_lines_new)):
-                                matched_lines_new[j]["num"] = 1  # if line is new
-
-                                # new data: matched_lines_new is already gererated instead matched_lines
-
-                                #            if len(matched_lines_new) > 0:
-                                #                print(len(matched_lines_new))
-                                #                print("Matched lines are:")
-                                #                print(matched_lines_new)
-                                #            else:
-                                #                logging.info("There is not any/new matched message from logfile/s")
-                                #                print("There is not any/new matched message from logfile/s")
-
-                        # Update fields value if required
-                        for j in range(len(matched_lines_new)):
-
-                            logging.debug("Update fields value if required")
-                            out_item_temp = copy.deepcopy(OUT_ITEM_SAMPLE)
-                            for k in out_item_temp.keys():
-                                #            print(mylist_logfile[i])
-                                if mylist_logfile_entry.get(k):
-                                    #
-                                    out_item_temp[k] = mylist_logfile_entry[k]
-
-                            # Update the output contents if there is relevant item from parameter file
-                            # for key in ["eventtype", "logfilename", "logfield1", "logfield2" ]:
-                            #     out_item_temp[key] = mylist_logfile_entry[key]
-                            out_item_temp["logeventtype"] = mylist_logfile_entry["eventtype"]
-                            #
-
-                            out_item_temp["responsible"] = mylist_logfile_entry.get("responsible", "")
-
-                            out_item_temp["actualnumberofhits"] = matched_lines_new[j].get("num",
-                                                                                           0)  # Update the number of hits
-                            out_item_temp["message"] = matched_lines_new[j].get("matched_contents", "")
-
-                            # REQ15: Get values for logfield1 & 2 from matched_lines_new[j].get("matched_contents")
-                            out_item_temp["logfield1"] = ''
-                            if mylist_logfile_entry.get("logfield1"):
-                                res = re.search(mylist_logfile_entry.get("logfield1"),
-                                                matched_lines_new[j].get("matched_contents"))
-                                if res:
-                                    out_item_temp["logfield1"] = res.group()
-
-                            out_item_temp["logfield2"] = ''
-                            if mylist_logfile_entry.get("logfield2"):
-                                res = re.search(mylist_logfile_entry.get("logfield2"),
-                                                matched_lines_new[j].get("matched_contents"))
-                                if res:
-                                    out_item_temp["logfield2"] = res.group()
-
-                            # Update the output contents with combination
-                            out_item_temp["resource"] = "%s:%s:%s:%s:%s" % (
-                                mylist_logfile_entry.get("instance", ""),
-                                mylist_logfile_entry.get("logfilename", ""),
-                                mylist_logfile_entry.get("eventtype", ""),
-                                out_item_temp["logfield1"],
-                                out_item_temp["logfield2"]
-                            )
-
-                            # Update the message with line's content
-
-                            # Set default rc & rcdesc
-                            if out_item_temp["rc"] == '':
-                                # set default
-                                RC = 0
-                                out_item_temp["rc"] = RC
-
-                            # Write data to output file
-                            # REQ13
-                            occurrences = int(mylist_logfile_entry.get("occurrences", 1))
-
-                            if out_item_temp["actualnumberofhits"] >= occurrences:
-                                write_data_outfile(out_item_temp)
-
-                            out_item_temp.clear()  # Clear for next searching
-
-                    # Update the last_number for every logicalname & logfilename to file: \
-                    # LAST_CHECKED_LINE from list variable: last_line_list
-                    logging.debug(
-                        "Update the last_number for every logicalname & logfilename to file: %s" % LAST_CHECKED_LINE)
-
-                    # Merge the contents between LAST_CHECKED_LINE and last_line_list to "-bak" file
-                    # Updated only when for "incremental"
-                    if read_type == "incremental":
-                        with open(LAST_CHECKED_LINE, 'r') as f1, open("%s-bak" % LAST_CHECKED_LINE, 'w') as f2:
-                            # If LAST_CHECKED_LINE has, but last_line_list has not, copy it to "-bak" file;
-                            # Both LAST_CHECKED_LINE and last_line_list have, write it with last_line_list value;
-                            for line in f1:
-                                l_logicalname, l_logfilename, l_number, l_size = line.split()
-                                existing_yn = False
-                                for item in last_line_list:
-                                    logicalname = item["logicalname"]
-                                    logfilename = item["logfilename"]
-                                    number = item["last_number"]
-                                    # for REQ3
-                                    size = item["file_size"]
-                                    if logicalname == l_logicalname and logfilename == l_logfilename:
-                                        existing_yn = True
-                                        # For REQ3, write the filesize into
-                                        size = os.path.getsize(logfilename)
-                                        f2.write("%s  %s  %d %d\n" % (logicalname, logfilename, number, size))
-                                        break
-                                if not existing_yn:
-                                    f2.write(line)
-
-                        # move the backup file to it
-                        os.remove(LAST_CHECKED_LINE)
-                        os.rename("%s-bak" % LAST_CHECKED_LINE, LAST_CHECKED_LINE)
-
-                        # copy all contents to the backup file
-                        with open(LAST_CHECKED_LINE, 'r') as f1, open("%s-bak" % LAST_CHECKED_LINE, 'w') as f2:
-                            for line in f1:
-                                f2.write(line)
-
-                        # append the some data to the backup file
-                        for item in last_line_list:
-                            # If last_line_list has, but LAST_CHECKED_LINE has not,
-                            # write it to "-bak" file with last_line_list values
-                            logicalname = item["logicalname"]
-                            logfilename = item["logfilename"]
-                            number = item["last_number"]
-                            size = item["file_size"]
-                            with open(LAST_CHECKED_LINE, 'r') as f1, open("%s-bak" % LAST_CHECKED_LINE, 'a') as f2:
-                                existing_yn = False
-                                for line in f1:
-                                    l_logicalname, l_logfilename, l_number, l_size = line.split()
-                                    if logicalname == l_logicalname and logfilename == l_logfilename:
-                                        existing_yn = True
-                                        break
-                                if not existing_yn:
-                                    f2.write("%s  %s  %d  %d\n" % (logicalname, logfilename, number, size))
-
-                        os.remove(LAST_CHECKED_LINE)
-                        os.rename("%s-bak" % LAST_CHECKED_LINE, LAST_CHECKED_LINE)
-
-                        logging.debug("After updated, the contents are: ")
-                        # logging.debug(os.system('cat LAST_CHECKED_LINE'))
-
-                # Sleep to next interval
-                time.sleep(SCRIPT_INTERVAL_RUN)
+                # Wait for the changes of logfiles with "-w inotify", or sleep to next interval
+                RUN_CYCLE.wait(SCRIPT_INTERVAL_RUN)
             elif script_mode == "read":
-
-                # exit if another deamon/process is already running for 'run'
-                names = ["LogfileMonitor -m read", "LogfileMonitor.py -m read"]
-                for name in names:
-                    if sys.platform == "linux":
-                        if process_already_running(name):
-                            logging.error(
-                                "The process(%s) is already running, Please verify with 'ps -f' command!!!" % name)
-                            RC = 7
-                            raise SystemExit(RC)
-                    else:
-                        logging.error("It is not supported to check the running process on other platforms")
-                        RC = 100
-                        raise SystemExit(RC)
-
                 # Generate the output format of READ mode
                 output_string_format = READ_OUTPUT_FORMAT["separator"].join(READ_OUTPUT_FORMAT["fields"].split())
                 logging.debug("The output string format is:\n%s" % output_string_format)
@@ -946,13 +3066,18 @@ def main():
                     RC = 2
                     raise SystemExit(RC)
 
+                if OUT_FORMAT == "jsonl":
+                    # Read the new data from the cursor, and Generate Standard Output
+                    read_jsonl_outfile()
+                    break
+
                 out_data = get_from_yaml(OUT_FILE)  # Get data from sample file
                 # Check if the YAML file is valid (list data type)
                 valid_yaml_format(OUT_FILE, out_data, "list")
 
                 try:
                     with open(OUT_FILE) as f:
-                        out_data = yaml.load(f)
+                        out_data = yaml.load(f, Loader=YAML_LOADER)
 
                         if out_data:
                             # If there is any data read into
@@ -1010,32 +3135,13 @@ def main():
 
                                 # 20190528-XJS : 1.0
                                 # Rotate the outfile with maxByte = 1M and 1 backup
-                                if os.path.getsize(OUT_FILE) > 1 * 1024 * 1024:
+                                if os.path.getsize(OUT_FILE) > OUT_FILE_MAX_SIZE:
                                     os.rename(OUT_FILE, "%s.1" % OUT_FILE)
                                     with open(OUT_FILE, "w"):
                                         print()
 
                             # Generate Standard Output for OUTPUT_ITEMS with OUT_FILE format
-                            if OUTPUT_ITEMS:
-
-                                separator = READ_OUTPUT_FORMAT["separator"]
-                                fields = READ_OUTPUT_FORMAT["fields"]
-
-                                for item in OUTPUT_ITEMS:
-                                    logging.debug("The item is: ")
-                                    logging.debug(item)
-                                    # return the item contents with output_string_format format
-                                    output_string = separator
-                                    for key in fields.split():
-                                        if str(item.get(key)):
-                                            output_string = "%s%s%s" % (output_string, separator, item[key])
-                                        else:
-                                            logging.error(
-                                                "The key of %s maybe wrong to defined in file: %s" % (key, OUT_FILE))
-                                            output_string = "%s%sNULL" % (output_string, separator)
-
-                                    output_string = output_string.strip(separator)
-                                    print(output_string)
+                            print_output_items(OUTPUT_ITEMS)
 
                         else:
                             logging.warning("There is not any data for input from file: %s" % OUT_FILE)
@@ -1069,7 +3175,20 @@ def main():
         print("99;;Undefined error message in script")
         sys.exit(99)
     finally:
-        pass
+        # Stop the worker processes
+        if WORKER_POOL:
+            WORKER_POOL.shutdown()
+
+        # Write the data which is buffered before exit
+        try:
+            flush_data_outfile()
+        except IOError as e:
+            logging.error(e)
+
+        # Write the queued logs
+        if LOG_LISTENER:
+            LOG_LISTENER.stop()
+            LOG_LISTENER = None
         #     # Clear temparory files
         # End of Main
 
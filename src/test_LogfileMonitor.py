@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding:utf8 -*-
+"""
+The behavior tests of LogfileMonitor.py for the checkpoints, the rotation of logfiles and the combined matcher
+Run with: python3 -m unittest test_LogfileMonitor (or python3 -m pytest) in src/
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import LogfileMonitor
+
+
+def make_rule(search_type, search_str, logicalname="test", read_type="incremental", deduplicate="n"):
+    """
+    :return: The search pattern (PatternRule) with the translated parameters
+    """
+    return LogfileMonitor.PatternRule(dict(logicalname=logicalname, logfilename="app.log", eventtype="Application",
+                                           patternsearchtype=search_type, patternsearch=search_str,
+                                           readtype=read_type, deduplicate=deduplicate))
+
+
+class LogfileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        LogfileMonitor.OUT_ITEM_SAMPLE = dict(rc="")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.logfilename = os.path.join(self.tmp_dir, "app.log")
+        self.store = LogfileMonitor.CheckpointStore(os.path.join(self.tmp_dir, "LogfileMonitor.loc"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, lines, mode="a", filename=None):
+        with open(filename or self.logfilename, mode) as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def scan(self, mylist_rule):
+        """
+        Scan the logfile as an interval of RUN mode, and commit the checkpoints
+        :return: The matched contents of every pattern
+        """
+        logicalnames = set(rule.logicalname for rule in mylist_rule)
+        matched_list, last_line_list, result_list, stats = LogfileMonitor.scan_logfile(
+            self.logfilename, mylist_rule, self.store.get_logfile(self.logfilename, logicalnames), {})
+        for item in last_line_list:
+            self.store.update(item)
+        self.store.commit()
+        return [[matched_contents for matched_contents, num in matched_lines.items()]
+                for matched_lines in matched_list]
+
+
+class TestCheckpointStore(LogfileTestCase):
+
+    def test_migrate_former_format(self):
+        self.write(["ERROR 1", "ERROR 2", "info", "ERROR 3", "ERROR 4"])
+        with open(self.store.filename, "w") as f:
+            f.write("logicalname     logfilename      0      0      0\n")
+            f.write("test  %s  3  24\n" % self.logfilename)
+        self.store.load()
+        self.assertIsNone(self.store.get("test", self.logfilename)["offset"])
+
+        # The lines before the 4th one are skipped, and the checkpoint is saved with the byte offset
+        self.assertEqual(self.scan([make_rule("regexp", r"ERROR \d")]), [["ERROR 3", "ERROR 4"]])
+        checkpoint = LogfileMonitor.CheckpointStore(self.store.filename).get("test", self.logfilename)
+        self.assertEqual(checkpoint["last_number"], 5)
+        self.assertEqual(checkpoint["offset"], os.path.getsize(self.logfilename))
+        self.assertEqual(checkpoint["inode"], os.stat(self.logfilename).st_ino)
+
+    def test_journal_replay(self):
+        self.write(["ERROR 1"])
+        rule = make_rule("regexp", r"ERROR \d")
+        self.scan([rule])
+        self.write(["ERROR 2"])
+        self.scan([rule])
+        with open(self.store.filename) as f:
+            lines = f.readlines()
+        # The changed checkpoint is appended, and the latest line wins
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(LogfileMonitor.CheckpointStore(self.store.filename).get("test", self.logfilename)["offset"],
+                         16)
+
+        # The last line is torn while it is appended, the former checkpoint is used and the file is compacted
+        with open(self.store.filename, "a") as f:
+            f.write(lines[-1][:20])
+        store = LogfileMonitor.CheckpointStore(self.store.filename)
+        self.assertEqual(store.get("test", self.logfilename)["offset"], 16)
+        with open(self.store.filename) as f:
+            self.assertEqual(f.readlines()[1:], lines[-1:])
+
+
+class TestIncremental(LogfileTestCase):
+
+    def test_partial_last_line(self):
+        rule = make_rule("regexp", r"ERROR \w+")
+        self.write(["ERROR 1"])
+        # The last line which is being written is left to the next interval
+        with open(self.logfilename, "a") as f:
+            f.write("second ERR")
+        self.assertEqual(self.scan([rule]), [["ERROR 1"]])
+        checkpoint = self.store.get("test", self.logfilename)
+        self.assertEqual((checkpoint["last_number"], checkpoint["offset"]), (1, 8))
+
+        self.write(["OR happened"])
+        self.assertEqual(self.scan([rule]), [["ERROR happened"]])
+        checkpoint = self.store.get("test", self.logfilename)
+        self.assertEqual((checkpoint["last_number"], checkpoint["offset"]), (2, os.path.getsize(self.logfilename)))
+
+
+class TestRotation(LogfileTestCase):
+
+    def test_rename(self):
+        rule = make_rule("regexp", r"ERROR \d")
+        self.write(["ERROR 1", "info"])
+        self.assertEqual(self.scan([rule]), [["ERROR 1"]])
+
+        # The lines appended before the rotation are read from the rotated file
+        self.write(["ERROR 2"])
+        os.rename(self.logfilename, self.logfilename + ".1")
+        self.write(["ERROR 3", "info", "ERROR 4"], "w")
+        self.assertEqual(self.scan([rule]), [["ERROR 2", "ERROR 3", "ERROR 4"]])
+        checkpoint = self.store.get("test", self.logfilename)
+        self.assertEqual(checkpoint["last_number"], 3)
+        self.assertEqual(checkpoint["offset"], os.path.getsize(self.logfilename))
+
+        self.write(["ERROR 5"])
+        self.assertEqual(self.scan([rule]), [["ERROR 5"]])
+
+    def test_copytruncate(self):
+        rule = make_rule("regexp", r"ERROR \d")
+        self.write(["ERROR 1", "info"])
+        self.assertEqual(self.scan([rule]), [["ERROR 1"]])
+
+        # The logfile is copied and truncated with the same inode, the unread lines are read from the copy
+        self.write(["ERROR 2"])
+        shutil.copyfile(self.logfilename, self.logfilename + ".1")
+        self.write(["ERROR 3"], "w")
+        self.assertEqual(self.scan([rule]), [["ERROR 2", "ERROR 3"]])
+        checkpoint = self.store.get("test", self.logfilename)
+        self.assertEqual(checkpoint["last_number"], 1)
+        self.assertEqual(checkpoint["offset"], os.path.getsize(self.logfilename))
+
+
+class TestLogfileMatcher(unittest.TestCase):
+
+    def setUp(self):
+        LogfileMonitor.OUT_ITEM_SAMPLE = dict(rc="")
+
+    def test_same_as_every_pattern(self):
+        rules = [make_rule("substring", "error"), make_rule("substring", "error: disk"),
+                 make_rule("substring", "disk"), make_rule("starts with", "kernel:"),
+                 make_rule("starts with", "kernel: error"), make_rule("ends with", "failed"),
+                 make_rule("ends with", "d"), make_rule("full", "error"), make_rule("full", "disk failed"),
+                 make_rule("regexp", r"session opened for user (\w+)"), make_rule("regexp", r"code=\d+"),
+                 make_rule("regexp", r"(?i)ERROR"), make_rule("regexp", r"^k.*d$")]
+        words = ["kernel:", "error", "error:", "disk", "failed", "session", "opened", "for", "user", "root",
+                 "code=42", "ERROR", "d", "", "errordisk", "ké"]
+        rand = random.Random(1)
+        lines = [" ".join(rand.choice(words) for i in range(rand.randint(0, 6))) for j in range(3000)]
+        lines += ["error", "disk failed", "kernel: error: disk failed", ""]
+
+        matcher = LogfileMonitor.LogfileMatcher(rules)
+        expected = [LogfileMonitor.HitCounter(rule) for rule in rules]
+        for line in lines:
+            self.assertEqual(sorted(matcher.match(line)),
+                             [(i, rules[i].match(line)) for i in range(len(rules)) if rules[i].match(line)], line)
+            for i in range(len(rules)):
+                if rules[i].match(line):
+                    expected[i].add(rules[i].match(line))
+
+        # The lines are searched in bytes with the prefilter as well
+        for rules_searched in [rules, [rule for rule in rules if rule.search_type != "regexp"]]:
+            matcher = LogfileMonitor.LogfileMatcher(rules_searched)
+            matched_list = [LogfileMonitor.HitCounter(rule) for rule in rules_searched]
+            data = "".join(line + "\r\n" for line in lines).encode("utf-8")
+            LogfileMonitor.search_lines(data, 0, len(data), matcher, [True] * len(rules_searched), matched_list)
+            self.assertEqual([matched_lines.items() for matched_lines in matched_list],
+                             [expected[rules.index(rule)].items() for rule in rules_searched])
+
+
+if __name__ == "__main__":
+    unittest.main()